@@ -0,0 +1,7 @@
+def __getattr__(name):
+    # ClassifyService pulls in TensorFlow, so it is imported only when requested;
+    # web workers use cv.stream without it
+    if name == 'ClassifyService':
+        from cv.predict import ClassifyService
+        return ClassifyService
+    raise AttributeError(f"module 'cv' has no attribute {name!r}")
@@ -0,0 +1,110 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from time import monotonic
+from typing import Callable
+
+import numpy as np
+
+
+class InferenceBatcher():
+    """
+    In-process inference server that merges tile tensors of concurrent callers.
+
+    Requests are queued and flushed to the model as one batch when the batch is
+    full or when the oldest request has waited for max_latency seconds.
+
+    Attributes:
+        predict (callable): runs the model over a batch of tiles
+        max_batch (int): number of tiles that triggers an immediate flush
+        max_latency (float): max time in seconds the first request waits for a batch
+    """
+
+    def __init__(self, predict: Callable[[np.ndarray], np.ndarray], max_batch: int = 256, max_latency: float = 0.05):
+        self.predict = predict
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.logger = logging.getLogger(__name__)
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name='inference-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, tiles: np.ndarray) -> Future:
+        """
+        Queue tiles for prediction
+
+        Args:
+            tiles (np.ndarray): normalized tiles of shape (n, height, width, channels)
+
+        Returns:
+            Future: resolves to model output for the given tiles
+
+        Raises:
+            RuntimeError: if the batcher is closed
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('InferenceBatcher is closed')
+            if not len(tiles):
+                future.set_result(np.empty((0,)))
+                return future
+            self._queue.put((tiles, future))
+        return future
+
+    def close(self):
+        """
+        Stop the batcher after flushing already queued requests
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            size = len(item[0])
+            deadline = monotonic() + self.max_latency
+            closed = False
+            while size < self.max_batch:
+                timeout = deadline - monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    closed = True
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._flush(batch)
+            if closed:
+                return
+
+    def _flush(self, batch: list[tuple[np.ndarray, Future]]):
+        batch = [(tiles, future) for tiles, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        self.logger.debug('Flushing %d requests with %d tiles', len(batch), sum(len(t) for t, _ in batch))
+        try:
+            x = np.concatenate([tiles for tiles, _ in batch]) if len(batch) > 1 else batch[0][0]
+            prediction = self.predict(x)
+        except Exception as exc:
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+        start = 0
+        for tiles, future in batch:
+            future.set_result(prediction[start:start + len(tiles)])
+            start += len(tiles)
@@ -0,0 +1,116 @@
+import threading
+
+import numpy as np
+
+from cv.model import TILE_SIZE
+
+SIGNATURE_SIZE = 8  # each tile is reduced to SIGNATURE_SIZE x SIGNATURE_SIZE grey block means
+CHANGE_THRESHOLD = 8.  # difference of any block mean (0-255) that counts as a changed tile
+
+
+class TileCache():
+    """
+    Per-url results of the last classified tiles, used to skip unchanged tiles.
+
+    Every tile is reduced to a small grey thumbnail (block means, so sensor and
+    JPEG noise is averaged out). A tile is classified again only when any
+    block of its thumbnail differs from the one it was last classified with by
+    more than threshold, otherwise its cached class is reused. Thumbnails of skipped
+    tiles are not updated, so slow drift adds up until the tile is re-run.
+
+    Attributes:
+        threshold (float): difference of any block mean that counts as change
+        tiles_total (int): tiles seen since start
+        tiles_skipped (int): tiles whose cached class was reused
+    """
+
+    def __init__(self, threshold: float = CHANGE_THRESHOLD):
+        self.threshold = threshold
+        self.tiles_total = 0
+        self.tiles_skipped = 0
+        self._entries: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def changed(self, key: str, img: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Finds tiles of frame that changed since they were classified
+
+        Args:
+            key (str): frame source, e.g. camera url
+            img (np.ndarray): uint8 frame of shape (height, width, 3)
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: signatures of all tiles and boolean mask of changed tiles
+                of shape (rows, cols)
+        """
+        signatures = self.signatures(img)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[0].shape != signatures.shape:
+            mask = np.ones(signatures.shape[:2], dtype=bool)
+        else:
+            # max, not mean: small local changes such as a thin string must not be averaged out
+            diff = np.abs(signatures - entry[0]).max(axis=(2, 3))
+            mask = diff > self.threshold
+        with self._lock:
+            self.tiles_total += mask.size
+            self.tiles_skipped += mask.size - int(mask.sum())
+        return signatures, mask
+
+    def update(self, key: str, signatures: np.ndarray, mask: np.ndarray, labels: np.ndarray) -> np.ndarray:
+        """
+        Stores classes of changed tiles and returns classes of all tiles
+
+        Args:
+            key (str): frame source passed to changed
+            signatures (np.ndarray): signatures returned by changed
+            mask (np.ndarray): changed tiles returned by changed
+            labels (np.ndarray): classes of changed tiles in row-major order
+
+        Returns:
+            np.ndarray: classes of all tiles in row-major order
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0].shape != signatures.shape:
+                cached_signatures, cached_labels = signatures, np.zeros(mask.shape, dtype=np.intp)
+            else:
+                cached_signatures, cached_labels = entry
+            cached_signatures[mask] = signatures[mask]
+            cached_labels[mask] = labels
+            self._entries[key] = cached_signatures, cached_labels
+            return cached_labels.reshape(-1).copy()
+
+    def forget(self, key: str):
+        """
+        Drops cached tiles of source, e.g. when it is not watched anymore
+
+        Args:
+            key (str): frame source
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Drops cached tiles of all sources
+        """
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def signatures(img: np.ndarray) -> np.ndarray:
+        """
+        Reduces every full tile of frame to grey block means
+
+        Args:
+            img (np.ndarray): frame of shape (height, width, channels)
+
+        Returns:
+            np.ndarray: float32 array of shape (rows, cols, SIGNATURE_SIZE, SIGNATURE_SIZE)
+        """
+        N, S = TILE_SIZE, SIGNATURE_SIZE
+        rows, cols = img.shape[0] // N, img.shape[1] // N
+        # view of blocks: (rows, S, block, cols, S, block, channels)
+        blocks = img[:rows * N, :cols * N].reshape(rows, S, N // S, cols, S, N // S, img.shape[2])
+        return blocks.mean(axis=(2, 5, 6), dtype=np.float32).transpose(0, 2, 1, 3)
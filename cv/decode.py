@@ -0,0 +1,131 @@
+import threading
+from collections import defaultdict
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+FREE_BUFFERS = 4  # released frame buffers kept for reuse per frame size
+PILLOW_BLOCKS = 16  # memory blocks Pillow keeps for reuse instead of freeing them after each decode
+
+
+def normalize(pixels: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+    """
+    Converts uint8 pixels to normalized float32 model input without temporary arrays
+
+    Conversion to float is done by the multiply loop itself in small chunks,
+    then 1 is added in place: (255 - pixels) / 255 == 1 - pixels / 255
+
+    Args:
+        pixels (np.ndarray): uint8 array of any shape, e.g. strided view of tiles
+        out (np.ndarray | None): float32 array of the same shape to write to
+
+    Returns:
+        np.ndarray: (255 - pixels) / 255 as float32
+    """
+    out = np.multiply(pixels, np.float32(-1. / 255.), out=out, dtype=np.float32)
+    out += np.float32(1.)
+    return out
+
+
+class FrameDecoder():
+    """
+    Decodes images into reusable uint8 buffers.
+
+    Pixels are decoded by Pillow straight into a preallocated RGBX buffer
+    mapped as Pillow image, and the frame is a (height, width, 3) view of it,
+    so no full-frame array is allocated per frame once buffers of the size
+    exist. JPEG frames can be downscaled by the decoder itself (draft mode),
+    which is much cheaper than resizing decoded pixels.
+
+    Attributes:
+        max_size (tuple[int, int] | None): (width, height) JPEG frames are reduced to
+            (at least this size, by a power of two), None to keep full size
+    """
+
+    def __init__(self, max_size: tuple[int, int] | None = None):
+        self.max_size = max_size
+        self._free: defaultdict[tuple[int, int], list[np.ndarray]] = defaultdict(list)
+        self._lock = threading.Lock()
+        Image.core.set_blocks_max(max(Image.core.get_blocks_max(), PILLOW_BLOCKS))
+
+    def decode(self, raw: bytes) -> np.ndarray:
+        """
+        Decodes image, call release when the frame is not needed anymore
+
+        Args:
+            raw (bytes): encoded image, e.g. JPEG frame of camera
+
+        Returns:
+            np.ndarray: uint8 view of shape (height, width, 3)
+        """
+        img = Image.open(BytesIO(raw))
+        if self.max_size:
+            img.draft('RGB', self.max_size)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img.load()
+        width, height = img.size
+        buffer = self._acquire(height, width)
+        # image shares memory with buffer; paste on the core skips Pillow copy-on-write of mapped images
+        target = Image.frombuffer('RGBX', (width, height), buffer, 'raw', 'RGBX', 0, 1)
+        target.im.paste(img.im, (0, 0, width, height))
+        return buffer[..., :3]
+
+    def release(self, frame: np.ndarray):
+        """
+        Returns buffer of decoded frame for reuse, frames not made by decode are ignored
+
+        Args:
+            frame (np.ndarray): frame returned by decode
+        """
+        buffer = frame.base
+        if not isinstance(buffer, np.ndarray) or buffer.dtype != np.uint8 \
+                or buffer.ndim != 3 or buffer.shape[2] != 4:
+            return
+        with self._lock:
+            free = self._free[buffer.shape[:2]]
+            if len(free) < FREE_BUFFERS and not any(buffer is other for other in free):
+                free.append(buffer)
+
+    def _acquire(self, height: int, width: int) -> np.ndarray:
+        with self._lock:
+            free = self._free[(height, width)]
+            if free:
+                return free.pop()
+        return np.empty((height, width, 4), dtype=np.uint8)
+
+
+if __name__ == '__main__':
+    import sys
+    import tracemalloc
+
+    # allocations per frame of the previous path (PIL -> float32 -> normalize) and of the decoder
+    with open(sys.argv[1], 'rb') as f:
+        raw = f.read()
+    frames = 50
+
+    def previous():
+        img = np.asarray(Image.open(BytesIO(raw)).convert('RGB'), dtype=np.float32)
+        x = img / -255.
+        x += 1.
+
+    decoder = FrameDecoder()
+    out = np.empty(decoder.decode(raw).shape, dtype=np.float32)
+
+    def current():
+        frame = decoder.decode(raw)
+        normalize(frame, out)
+        decoder.release(frame)
+
+    for name, step in (('previous', previous), ('decoder', current)):
+        step()
+        tracemalloc.start()
+        peaks = []
+        for _ in range(frames):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            step()
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        tracemalloc.stop()
+        print(f'{name}: {sum(peaks) // frames // 1024} KiB allocated per frame on average')
@@ -0,0 +1,147 @@
+import argparse
+import logging
+import os
+from time import perf_counter
+from typing import Iterator
+
+import numpy as np
+
+from cv.decode import FrameDecoder, normalize
+from cv.model import MODEL_PATH, TILE_SIZE, ModelHandle, TFLiteModelHandle
+from cv.tiles import frame_error, split_tiles
+
+DATASET_PATH = './cv/dataset/val'
+CALIBRATION_TILES = 500  # max tiles used to calibrate INT8 ranges
+MIN_AGREEMENT = 0.98  # share of tiles that must get the same class as with Keras
+
+logger = logging.getLogger(__name__)
+
+
+def dataset_tiles(dataset_path: str = DATASET_PATH) -> Iterator[tuple[str, np.ndarray, tuple[int, ...]]]:
+    """
+    Reads images of dataset and prepares them exactly like ClassifyService does
+
+    Args:
+        dataset_path (str): directory with one subdirectory of images per class
+
+    Yields:
+        tuple[str, np.ndarray, tuple[int, ...]]: class name, normalized tiles and shape of one image
+    """
+    decoder = FrameDecoder()
+    for label in sorted(os.listdir(dataset_path)):
+        directory = os.path.join(dataset_path, label)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), 'rb') as f:
+                img = decoder.decode(f.read())
+            tiles = split_tiles(img)
+            x = normalize(tiles).reshape(-1, TILE_SIZE, TILE_SIZE, img.shape[2])
+            decoder.release(img)
+            yield label, x, img.shape
+
+
+def export(model_path: str = MODEL_PATH, output_path: str | None = None, int8: bool = False,
+           dataset_path: str = DATASET_PATH) -> str:
+    """
+    Converts Keras model to TensorFlow Lite
+
+    Args:
+        model_path (str): path to Keras model
+        output_path (str | None): path to the result, model path with .tflite extension by default
+        int8 (bool): quantize weights and activations to INT8, ranges are calibrated on dataset
+        dataset_path (str): calibration dataset
+
+    Returns:
+        str: path to exported model
+    """
+    import tensorflow as tf
+
+    output_path = output_path or os.path.splitext(model_path)[0] + '.tflite'
+    model = ModelHandle(model_path).model
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if int8:
+        def representative_dataset():
+            count = 0
+            for _, tiles, _ in dataset_tiles(dataset_path):
+                for tile in tiles:
+                    yield [tile[np.newaxis]]
+                    count += 1
+                    if count >= CALIBRATION_TILES:
+                        return
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        # input stays float, so ClassifyService feeds both backends the same way
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+    logger.info('Model exported to %s (%d KiB)', output_path, os.path.getsize(output_path) // 1024)
+    return output_path
+
+
+def check_parity(model_path: str = MODEL_PATH, exported_path: str | None = None,
+                 dataset_path: str = DATASET_PATH, batch_size: int = 256) -> dict:
+    """
+    Compares predictions of exported model with the Keras model on dataset
+
+    Args:
+        model_path (str): path to Keras model
+        exported_path (str | None): path to TensorFlow Lite model, model path with .tflite extension by default
+        dataset_path (str): dataset with one subdirectory of images per class
+        batch_size (int): max number of tiles in one forward pass
+
+    Returns:
+        dict: tile agreement, max probability difference, image results agreement and timings
+    """
+    exported_path = exported_path or os.path.splitext(model_path)[0] + '.tflite'
+    keras_model = ModelHandle(model_path)
+    tflite_model = TFLiteModelHandle(exported_path)
+    keras_time = tflite_time = 0.
+    tiles_total = tiles_same = images_same = images_total = 0
+    max_diff = 0.
+    for _, tiles, shape in dataset_tiles(dataset_path):
+        if not len(tiles):
+            continue
+        begin = perf_counter()
+        expected = keras_model.predict(tiles, batch_size)
+        keras_time += perf_counter() - begin
+        begin = perf_counter()
+        actual = tflite_model.predict(tiles, batch_size)
+        tflite_time += perf_counter() - begin
+        expected_classes, actual_classes = expected.argmax(axis=1), actual.argmax(axis=1)
+        tiles_total += len(tiles)
+        tiles_same += int((expected_classes == actual_classes).sum())
+        max_diff = max(max_diff, float(np.abs(expected - actual).max()))
+        images_total += 1
+        images_same += frame_error(expected_classes, shape) == frame_error(actual_classes, shape)
+    return {
+        'tiles': tiles_total,
+        'tile_agreement': tiles_same / tiles_total if tiles_total else 1.,
+        'image_agreement': images_same / images_total if images_total else 1.,
+        'max_probability_diff': max_diff,
+        'keras_time': keras_time,
+        'tflite_time': tflite_time,
+        'tflite_size': os.path.getsize(exported_path),
+    }
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Export classifier to TensorFlow Lite and check its accuracy')
+    parser.add_argument('--model', default=MODEL_PATH, help='Keras model')
+    parser.add_argument('--output', default=None, help='exported model, .tflite next to Keras model by default')
+    parser.add_argument('--int8', action='store_true', help='post-training INT8 quantization')
+    parser.add_argument('--dataset', default=DATASET_PATH, help='calibration and parity check dataset')
+    parser.add_argument('--check-only', action='store_true', help='only compare existing export with Keras model')
+    parser.add_argument('--min-agreement', type=float, default=MIN_AGREEMENT,
+                        help='min share of tiles classified the same as with Keras')
+    args = parser.parse_args()
+    output = args.output
+    if not args.check_only:
+        output = export(args.model, output, args.int8, args.dataset)
+    report = check_parity(args.model, output, args.dataset)
+    for key, value in report.items():
+        print(f'{key}: {value}')
+    if report['tile_agreement'] < args.min_agreement:
+        raise SystemExit(f'Tile agreement {report["tile_agreement"]:.3f} is below {args.min_agreement}')
@@ -0,0 +1,184 @@
+import logging
+import threading
+from time import perf_counter
+
+import numpy as np
+
+MODEL_PATH = './cv/neuro.h5'
+TILE_SIZE = 80  # width and length of each tile
+CHANNELS = 3
+WARMUP_BATCH = 64  # tiles in the dummy batch passed to the model on warm-up
+
+
+class ModelHandle():
+    """
+    Lazily loaded Keras model shared by the whole process.
+
+    TensorFlow is imported and the model is loaded on first use, so processes
+    that import cv but never classify do not pay for it. warm_up runs a dummy
+    batch of production tile shape to trace the prediction graph before the
+    first real frame.
+
+    Attributes:
+        path (str): path to saved model
+        threads (int | None): intra-op threads of the runtime, its default if None
+        load_time (float | None): seconds spent importing TensorFlow and loading the model
+        warmup_time (float | None): seconds spent on the first (dummy) prediction
+    """
+
+    def __init__(self, path: str = MODEL_PATH, threads: int | None = None):
+        self.path = path
+        self.threads = threads
+        self.load_time: float | None = None
+        self.warmup_time: float | None = None
+        self.logger = logging.getLogger(__name__)
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def model(self):
+        """
+        Loaded model, loaded on first access
+        """
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    begin = perf_counter()
+                    model = self._load()
+                    self.load_time = perf_counter() - begin
+                    self.logger.info('Model %s loaded in %.2f s', self.path, self.load_time)
+                    self._model = model
+        return self._model
+
+    def predict(self, x: np.ndarray, batch_size: int) -> np.ndarray:
+        """
+        Args:
+            x (np.ndarray): tiles of shape (n, TILE_SIZE, TILE_SIZE, CHANNELS)
+            batch_size (int): max number of tiles in one forward pass
+
+        Returns:
+            np.ndarray: class probabilities of shape (n, classes)
+        """
+        return self._predict(self.model, x, batch_size)
+
+    def warm_up(self, batch_size: int = WARMUP_BATCH) -> dict:
+        """
+        Loads model and runs dummy batch through it
+
+        Args:
+            batch_size (int): number of dummy tiles
+
+        Returns:
+            dict: load and warm-up timings in seconds
+        """
+        model = self.model
+        if self.warmup_time is None:
+            begin = perf_counter()
+            self._predict(model, np.zeros((batch_size, TILE_SIZE, TILE_SIZE, CHANNELS), dtype=np.float32),
+                          batch_size)
+            self.warmup_time = perf_counter() - begin
+            self.logger.info('Model %s warmed up in %.2f s', self.path, self.warmup_time)
+        return self.timings()
+
+    def timings(self) -> dict:
+        """
+        Returns:
+            dict: load and warm-up timings in seconds, None for steps not done yet
+        """
+        return {'load': self.load_time, 'warmup': self.warmup_time}
+
+    def _load(self):
+        if self.threads:
+            import tensorflow as tf
+            try:
+                tf.config.threading.set_intra_op_parallelism_threads(self.threads)
+                tf.config.threading.set_inter_op_parallelism_threads(1)
+            except RuntimeError as exc:
+                # TensorFlow was already initialized in this process
+                self.logger.warning('Failed to limit TensorFlow threads: %s', exc)
+        import keras
+        return keras.models.load_model(self.path)
+
+    def _predict(self, model, x: np.ndarray, batch_size: int) -> np.ndarray:
+        return model.predict(x, batch_size=batch_size, verbose=0)
+
+
+class TFLiteModelHandle(ModelHandle):
+    """
+    Lazily loaded TensorFlow Lite model (see cv.export), same interface as ModelHandle.
+
+    Uses the small tflite_runtime package if it is installed and TensorFlow
+    otherwise. Quantized (INT8) inputs and outputs are converted from and to
+    float, so callers do not depend on the way the model was exported.
+    """
+
+    def __init__(self, path: str, threads: int | None = None):
+        super().__init__(path, threads)
+        # interpreter is not thread-safe
+        self._predict_lock = threading.Lock()
+
+    def _load(self):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+        interpreter = Interpreter(model_path=self.path, num_threads=self.threads)
+        interpreter.allocate_tensors()
+        return interpreter
+
+    def _predict(self, interpreter, x: np.ndarray, batch_size: int) -> np.ndarray:
+        outputs = []
+        with self._predict_lock:
+            for begin in range(0, len(x), batch_size):
+                outputs.append(self._invoke(interpreter, x[begin:begin + batch_size]))
+        return np.concatenate(outputs) if len(outputs) > 1 else outputs[0]
+
+    @staticmethod
+    def _invoke(interpreter, x: np.ndarray) -> np.ndarray:
+        input_details = interpreter.get_input_details()[0]
+        if input_details['shape'][0] != len(x):
+            interpreter.resize_tensor_input(input_details['index'], (len(x), *x.shape[1:]))
+            interpreter.allocate_tensors()
+            input_details = interpreter.get_input_details()[0]
+        if input_details['dtype'] != np.float32:
+            scale, zero_point = input_details['quantization']
+            info = np.iinfo(input_details['dtype'])
+            x = np.clip(np.round(x / scale + zero_point), info.min, info.max)
+        interpreter.set_tensor(input_details['index'], x.astype(input_details['dtype'], copy=False))
+        interpreter.invoke()
+        output_details = interpreter.get_output_details()[0]
+        y = interpreter.get_tensor(output_details['index'])
+        if output_details['dtype'] != np.float32:
+            scale, zero_point = output_details['quantization']
+            return (y.astype(np.float32) - zero_point) * scale
+        # tensor memory is reused by the next invoke
+        return y.copy()
+
+
+_handles: dict[str, ModelHandle] = {}
+_handles_lock = threading.Lock()
+
+
+def get_model(path: str = MODEL_PATH, threads: int | None = None) -> ModelHandle:
+    """
+    Gets process-wide handle of model, nothing is loaded until it is used
+
+    Backend is chosen by file extension: '.tflite' models run on TensorFlow Lite,
+    the rest are loaded with Keras
+
+    Args:
+        path (str): path to saved model
+        threads (int | None): intra-op threads, used only when the handle is created
+
+    Returns:
+        ModelHandle: shared handle
+    """
+    with _handles_lock:
+        if path not in _handles:
+            handle = TFLiteModelHandle if path.endswith('.tflite') else ModelHandle
+            _handles[path] = handle(path, threads)
+        return _handles[path]
@@ -1,15 +1,20 @@
 import logging
 import threading
-from io import BytesIO
-from random import randint
-from time import sleep
 from typing import Callable
 
-import keras
 import numpy as np
 import requests
-from keras.utils import img_to_array, load_img
-from PIL.Image import Image
+
+from cv.batcher import InferenceBatcher
+from cv.change import CHANGE_THRESHOLD, TileCache
+from cv.decode import FrameDecoder, normalize
+from cv.model import CHANNELS, MODEL_PATH, TILE_SIZE, ModelHandle, get_model
+from cv.scheduler import WatchScheduler
+from cv.stream import MJPEGStream, is_multipart
+from cv.tiles import frame_error, split_tiles
+from cv.workers import InferencePool
+
+FRAME_MAX_AGE = 10.  # frame of camera stream older than this many seconds is stale, e.g. camera froze
 
 
 class ClassifyService():
@@ -17,15 +22,65 @@ class ClassifyService():
     Service for classifying 3D printing errors
 
     Attributes:
-        model (keras.models.Model): cv model used for classifying images
+        model (ModelHandle): shared cv model, Keras or TensorFlow Lite by model_path extension (see cv.export),
+            loaded on first classification
+        batch_size (int): max number of tiles passed to the model in one forward pass
+        scheduler (WatchScheduler | None): scheduler of watched urls, created on first watch
+        batcher (InferenceBatcher): queue that merges tiles of concurrent callers into one model call
+        pool (InferencePool | None): worker processes running the model, None if it runs in this process
+        decoder (FrameDecoder): decodes images into reusable uint8 buffers, optionally downscaled
+        tile_cache (TileCache | None): classes of unchanged tiles of watched urls, None if every tile is classified
+        session (requests.Session): keep-alive session for snapshot and stream requests
+        streams (dict[str, MJPEGStream]): open camera streams by url
+        sources (dict[str, callable]): external frame sources of watched urls
+        timeout (float): network timeout in seconds
+        io_workers (int | None): max number of concurrent downloads of watched urls, None for one per watch
     """
 
-    def __init__(self, model_path: str = './cv/neuro.h5'):
-        self.model = keras.models.load_model(model_path)
-        self.workers = {}
+    def __init__(self, model_path: str = MODEL_PATH, batch_size: int = 256, max_latency: float = 0.05,
+                 timeout: float = 5., warm_up: bool = False, workers: int = 0, intra_op_threads: int | None = None,
+                 decode_size: tuple[int, int] | None = None, change_threshold: float = CHANGE_THRESHOLD,
+                 io_workers: int | None = None):
+        self.model: ModelHandle = get_model(model_path, intra_op_threads)
+        self.batch_size = batch_size
+        self.pool: InferencePool | None = None
+        if workers:
+            # each worker gets an equal part of a full batch
+            self.pool = InferencePool(model_path, workers, intra_op_threads or 1, -(-batch_size // workers))
+        self.batcher = InferenceBatcher(self.pool.predict if self.pool else self._predict, batch_size, max_latency)
+        self.decoder = FrameDecoder(decode_size)
+        # 0 turns gating off: every tile of watched frames is classified
+        self.tile_cache = TileCache(change_threshold) if change_threshold else None
+        # float32 model input of each classifying thread, grown when needed and reused
+        self._inputs = threading.local()
+        self.scheduler: WatchScheduler | None = None
+        self.session = requests.Session()
+        self.streams: dict[str, MJPEGStream] = {}
+        self.sources: dict[str, Callable[[], bytes | None]] = {}
+        self._streams_lock = threading.Lock()
+        self.timeout = timeout
+        self.io_workers = io_workers
         self.logger = logging.getLogger(__name__)
+        if warm_up:
+            threading.Thread(target=self.warm_up, name='model-warmup', daemon=True).start()
         self.logger.debug('ClassifyService initialized')
 
+    def warm_up(self) -> dict:
+        """
+        Loads model and traces prediction graph before the first frame, e.g. at process startup
+
+        Returns:
+            dict: load and warm-up timings in seconds
+        """
+        if self.pool:
+            timings = self.pool.warm_up()
+            self.logger.info('%d inference workers ready: %s', len(timings), timings)
+            return timings[0]
+        timings = self.model.warm_up()
+        self.logger.info('Model ready: loaded in %.2f s, warmed up in %.2f s',
+                         timings['load'], timings['warmup'])
+        return timings
+
     def classify_image(self, img_path: str) -> str:
         """
         Classify error on image
@@ -38,9 +93,9 @@ class ClassifyService():
         """
         with open(img_path, 'rb') as f:
             raw_img = f.read()
-        img = load_img(BytesIO(raw_img))
+        img = self.decoder.decode(raw_img)
         self.logger.debug('Image successfully loaded from %s', img_path)
-        return self._classify_error(img)
+        return self._classify_frames([img])[0]
 
     def classify_url(self, url: str) -> str:
         """
@@ -52,73 +107,130 @@ class ClassifyService():
         Returns:
             str: error code
         """
+        img = self._load_url(url)
+        if img is None:
+            return ''
+        return self._classify_frames([img])[0]
+
+    def _load_url(self, url: str) -> np.ndarray | None:
         try:
-            raw_img = requests.get(url).content
+            raw_img = self._download(url)
         except Exception as exc:
             self.logger.error('Failed to download image from %s: %s', url, exc)
-            return ''
-        img = load_img(BytesIO(raw_img))
+            return None
+        if not raw_img:
+            self.logger.debug('No fresh frame received from %s', url)
+            return None
+        img = self.decoder.decode(raw_img)
         self.logger.debug('Image successfully downloaded from %s', url)
-        return self._classify_error(img)
-
-    def _classify_error(self, img: Image) -> str:
-        N = 80  # width and length of each tile
-        errors = []
-        img = img_to_array(img)
-        tiles = [img[x:x+N, y:y+N]
-                 for x in range(0, img.shape[0], N) for y in range(0, img.shape[1], N)]
-        self.logger.debug('Image split into %d tiles', len(tiles))
-        classes = ['clear', 'overheating', 'stringing']
-        for tile in tiles:
-            if tile.shape != (N, N, 3):
-                continue
-            x = 255 - tile
-            x /= 255
-            x = np.expand_dims(x, axis=0)
-            prediction = self.model.predict(x, verbose=0)
-            prediction = np.argmax(prediction, axis=1)
-            result = classes[prediction[0]]
-            if result and result != 'clear':
-                errors.append(result)
-        self.logger.debug('Found errors: %s', errors)
-        # find most common error and check if it is not just noise
-        if errors:
-            common = max(set(errors), key=errors.count)
-            if len(errors) / len(tiles) > 0.5:  # todo: check if this is good enough
-                return common
-        return ''
+        return img
 
-    def _worker(self, url: str, callback: Callable | None, metadata: str, delay: float):
+    def _download(self, url: str) -> bytes | None:
         """
-        Infinite worker for classify_url
+        Get the latest image from url; multipart (MJPEG) urls are kept open as streams
 
         Args:
-            url (str): link to image
-            callback (callable | None): callback function with two str arguments
-            metadata (str): metadata to pass to callback
-            delay (float): delay between requests
+            url (str): link to image or camera stream
+
+        Returns:
+            bytes | None: raw image or None if stream has no frame yet or its last frame is stale
         """
-        while True:
-            res = self.classify_url(url)
-            if res and callback:
-                callback(res, metadata)
-            sleep(delay)
+        if url in self.sources:
+            return self.sources[url]()
+        if url in self.streams:
+            return self.streams[url].latest(wait=self.timeout, max_age=FRAME_MAX_AGE)
+        with self.session.get(url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            if not is_multipart(response):
+                return response.content
+        self.logger.debug('Opening camera stream %s', url)
+        with self._streams_lock:
+            if url not in self.streams:
+                self.streams[url] = MJPEGStream(url, self.session, timeout=self.timeout)
+            stream = self.streams[url]
+        return stream.latest(wait=self.timeout, max_age=FRAME_MAX_AGE)
 
-    def start_watching(self, url: str, callback: Callable | None = None, metadata: str = '', delay: float = 10.):
+    def _classify_frames(self, frames: list[np.ndarray], urls: list[str] | None = None) -> list[str]:
+        """
+        Classify errors on several frames with one forward pass
+
+        Frames made by decoder are released to it afterwards. If urls are given
+        and gating is on, only tiles that changed since the previous frame of
+        the same url are classified, the rest keep their cached classes.
+
+        Args:
+            frames (list[np.ndarray]): uint8 image arrays of shape (height, width, 3)
+            urls (list[str] | None): source url of each frame
+
+        Returns:
+            list[str]: error code for each frame
+        """
+        try:
+            return self._classify_tiles(frames, urls)
+        finally:
+            for img in frames:
+                self.decoder.release(img)
+
+    def _classify_tiles(self, frames: list[np.ndarray], urls: list[str] | None) -> list[str]:
+        classes = ['clear', 'overheating', 'stringing']
+        tiles = [split_tiles(img) for img in frames]
+        changes = [None] * len(frames)
+        if urls and self.tile_cache:
+            changes = [self.tile_cache.changed(url, img) for url, img in zip(urls, frames)]
+        counts = [t.shape[0] * t.shape[1] if change is None else int(change[1].sum())
+                  for t, change in zip(tiles, changes)]
+        self.logger.debug('Frames split into %s tiles to classify', counts)
+        prediction = np.empty(0, dtype=np.intp)
+        if sum(counts):
+            x = self._input(sum(counts))
+            offset = 0
+            for t, change, count in zip(tiles, changes, counts):
+                # tiles of all frames are normalized straight into one model input
+                if change is None:
+                    normalize(t, x[offset:offset + count].reshape(t.shape))
+                elif count:
+                    normalize(t[change[1]], x[offset:offset + count])
+                offset += count
+            prediction = self.batcher.submit(x).result()
+            prediction = np.argmax(prediction, axis=1)
+        frame_labels = np.split(prediction, np.cumsum(counts)[:-1])
+        for i, change in enumerate(changes):
+            if change is not None:
+                frame_labels[i] = self.tile_cache.update(urls[i], *change, frame_labels[i])
+        results = []
+        for img, labels in zip(frames, frame_labels):
+            self.logger.debug('Found errors: %s', [classes[i] for i in labels if i])
+            error = frame_error(labels, img.shape)
+            results.append(classes[error] if error else '')
+        return results
+
+    def _input(self, count: int) -> np.ndarray:
+        buffer = getattr(self._inputs, 'buffer', None)
+        if buffer is None or len(buffer) < count:
+            buffer = self._inputs.buffer = np.empty((count, TILE_SIZE, TILE_SIZE, CHANNELS), dtype=np.float32)
+        return buffer[:count]
+
+    def _predict(self, x: np.ndarray) -> np.ndarray:
+        return self.model.predict(x, self.batch_size)
+
+    def start_watching(self, url: str, callback: Callable | None = None, metadata: str = '', delay: float = 10.,
+                       source: Callable[[], bytes | None] | None = None):
         """
         Start continuous watching for errors on given url
 
         Args:
             url (str): link to image
-            callback (callable | None): callback function with one str argument
+            callback (callable | None): callback function with two str arguments
             metadata (str): metadata to pass to callback
-            delay (float): delay between requests
+            delay (float): delay between requests, randomly jittered per request
+            source (callable | None): returns latest JPEG instead of downloading url,
+                e.g. frame buffer of camera relay shared with web clients
         """
-        # delay += randint(-100, 100) / 100  # todo: find better solution
-        worker = threading.Thread(
-            target=self._worker, args=(url, callback, metadata, delay))
-        worker.start()
-        self.workers[url] = worker
+        if source is not None:
+            self.sources[url] = source
+        if self.scheduler is None:
+            self.scheduler = WatchScheduler(self._load_url, self._classify_frames, self.io_workers)
+        self.scheduler.add(url, callback, metadata, delay)
 
     def stop_watching(self, url: str):
         """
@@ -127,23 +239,43 @@ class ClassifyService():
         Args:
             url (str): link to image
         """
-        if url not in self.workers:
-            return
-        self.workers[url].stop()
-        del self.workers[url]
+        if self.scheduler is not None:
+            self.scheduler.remove(url)
+        self.sources.pop(url, None)
+        if self.tile_cache:
+            self.tile_cache.forget(url)
+        stream = self.streams.pop(url, None)
+        if stream:
+            stream.close()
 
     def stop_all(self):
         """
         Stop watching for errors on all urls
         """
-        for url in self.workers:
-            self.stop_watching(url)
+        if self.scheduler is not None:
+            self.scheduler.shutdown()
+            self.scheduler = None
+        self.sources.clear()
+        if self.tile_cache:
+            self.tile_cache.clear()
+        for url in list(self.streams):
+            self.streams.pop(url).close()
+
+    def close(self):
+        """
+        Stop watching and release model workers
+        """
+        self.stop_all()
+        self.batcher.close()
+        if self.pool:
+            self.pool.close()
 
 
 if __name__ == '__main__':
     from os import listdir
+    from time import sleep
     # logging.basicConfig(level=logging.DEBUG)
-    service = ClassifyService()
+    service = ClassifyService(warm_up=True)
     # print(service.classify_url('https://cdn.thingiverse.com/assets/7b/1f/cf/77/89/large_display_2900430c-2d9f-450c-9702-142b445cb165.jpg'))
     # print(service.classify_url('https://cdn.thingiverse.com/assets/8e/d8/b7/e9/da/large_display_c7d8ede9-33b4-48f9-8dda-49e227b06c64.jpg'))
     # print(service.classify_image('./cv/dataset/val/stringing/str6.jpg'))
@@ -151,3 +283,8 @@ if __name__ == '__main__':
     # for img in listdir('./cv/dataset/val/overheating'):
     # print(service.classify_image(f'./cv/dataset/val/overheating/{img}'))
     service.start_watching('https://cdn.thingiverse.com/assets/7b/1f/cf/77/89/large_display_2900430c-2d9f-450c-9702-142b445cb165.jpg', print, 5)
+    try:
+        while True:
+            sleep(1)
+    except KeyboardInterrupt:
+        service.close()
@@ -0,0 +1,180 @@
+import heapq
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from random import uniform
+from time import monotonic
+from typing import Callable
+
+import numpy as np
+
+MAX_IO_WORKERS = 64  # cap of I/O threads when they are sized by the number of watches
+
+
+@dataclass(eq=False)
+class Watch():
+    """
+    Watched camera url and its callback settings
+    """
+    url: str
+    callback: Callable | None
+    metadata: str
+    delay: float
+    active: bool = field(default=True)
+
+
+class WatchScheduler():
+    """
+    Scheduler that owns all watched urls of ClassifyService.
+
+    Frames are fetched concurrently on an I/O pool and handed to a single
+    inference thread, which classifies frames from different printers in one batch.
+    Each watch has at most one fetch in flight, so by default the pool grows with
+    the number of watches and a slow camera does not delay the others.
+
+    Attributes:
+        fetch (callable): loads image array from url, returns None on failure
+        classify (callable): classifies list of image arrays and list of their urls, returns list of error codes
+        io_workers (int | None): max number of concurrent fetches, None for one per watch
+        max_batch (int): max number of frames classified together
+        jitter (float): relative random deviation of each watch delay
+    """
+
+    def __init__(self, fetch: Callable[[str], np.ndarray | None],
+                 classify: Callable[[list[np.ndarray], list[str]], list[str]],
+                 io_workers: int | None = None, max_batch: int = 8, jitter: float = 0.1):
+        self.fetch = fetch
+        self.classify = classify
+        self.io_workers = io_workers
+        self.max_batch = max_batch
+        self.jitter = jitter
+        self.watches: dict[str, Watch] = {}
+        self.logger = logging.getLogger(__name__)
+        self._heap: list[tuple[float, int, Watch]] = []
+        self._counter = 0
+        self._cond = threading.Condition()
+        self._frames: queue.Queue = queue.Queue()
+        # threads are started lazily and reused when idle, so the cap is only reached with as many watches
+        self._io = ThreadPoolExecutor(max_workers=io_workers or MAX_IO_WORKERS, thread_name_prefix='watch-io')
+        self._stopped = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._schedule_loop, name='watch-scheduler', daemon=True),
+            threading.Thread(target=self._inference_loop, name='watch-inference', daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def add(self, url: str, callback: Callable | None = None, metadata: str = '', delay: float = 10.):
+        """
+        Start watching url, replacing previous watch for the same url
+
+        Args:
+            url (str): link to image
+            callback (callable | None): callback function with two str arguments
+            metadata (str): metadata to pass to callback
+            delay (float): delay between requests
+        """
+        self.remove(url)
+        watch = Watch(url, callback, metadata, delay)
+        with self._cond:
+            self.watches[url] = watch
+            self._push(watch, monotonic() + uniform(0, delay))
+        self.logger.debug('Started watching %s every %.1f s', url, delay)
+
+    def remove(self, url: str):
+        """
+        Stop watching url; frames already in flight are dropped
+
+        Args:
+            url (str): link to image
+        """
+        with self._cond:
+            watch = self.watches.pop(url, None)
+            if watch:
+                watch.active = False
+                self.logger.debug('Stopped watching %s', url)
+
+    def shutdown(self):
+        """
+        Stop watching all urls and terminate scheduler threads
+        """
+        with self._cond:
+            for url in list(self.watches):
+                self.remove(url)
+            self._stopped.set()
+            self._cond.notify()
+        self._frames.put(None)
+        self._io.shutdown(wait=False, cancel_futures=True)
+
+    def _push(self, watch: Watch, due: float):
+        self._counter += 1
+        heapq.heappush(self._heap, (due, self._counter, watch))
+        self._cond.notify()
+
+    def _reschedule(self, watch: Watch):
+        delay = watch.delay * uniform(1 - self.jitter, 1 + self.jitter)
+        with self._cond:
+            if watch.active:
+                self._push(watch, monotonic() + delay)
+
+    def _schedule_loop(self):
+        while not self._stopped.is_set():
+            with self._cond:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due, _, watch = self._heap[0]
+                timeout = due - monotonic()
+                if timeout > 0:
+                    self._cond.wait(timeout)
+                    continue
+                heapq.heappop(self._heap)
+                # checked under the lock: shutdown stops the I/O pool only after setting the flag
+                if watch.active and not self._stopped.is_set():
+                    self._io.submit(self._fetch, watch)
+
+    def _fetch(self, watch: Watch):
+        try:
+            frame = self.fetch(watch.url)
+        except Exception as exc:
+            self.logger.error('Failed to fetch frame from %s: %s', watch.url, exc)
+            frame = None
+        if frame is None:
+            self._reschedule(watch)
+            return
+        self._frames.put((watch, frame))
+
+    def _inference_loop(self):
+        while True:
+            item = self._frames.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._frames.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._frames.put(None)
+                    break
+                batch.append(item)
+            batch = [(watch, frame) for watch, frame in batch if watch.active]
+            if batch:
+                self._process(batch)
+
+    def _process(self, batch: list[tuple[Watch, np.ndarray]]):
+        try:
+            results = self.classify([frame for _, frame in batch], [watch.url for watch, _ in batch])
+        except Exception as exc:
+            self.logger.error('Failed to classify %d frames: %s', len(batch), exc)
+            results = [''] * len(batch)
+        for (watch, _), res in zip(batch, results):
+            if res and watch.callback and watch.active:
+                try:
+                    watch.callback(res, watch.metadata)
+                except Exception as exc:
+                    self.logger.error('Callback for %s failed: %s', watch.url, exc)
+            self._reschedule(watch)
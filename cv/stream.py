@@ -0,0 +1,185 @@
+import logging
+import threading
+from time import monotonic
+
+import requests
+
+
+class MultipartParser():
+    """
+    Incremental parser of multipart/x-mixed-replace body (mjpg-streamer format)
+
+    Attributes:
+        boundary (bytes): part delimiter including leading dashes
+    """
+
+    def __init__(self, boundary: str):
+        boundary = boundary.strip('"')
+        if not boundary.startswith('--'):
+            boundary = '--' + boundary
+        self.boundary = boundary.encode()
+        self._buffer = bytearray()
+
+    def feed(self, chunk: bytes) -> bytes | None:
+        """
+        Add chunk of data from socket
+
+        Args:
+            chunk (bytes): next piece of response body
+
+        Returns:
+            bytes | None: payload of the latest part completed by this chunk
+        """
+        self._buffer += chunk
+        latest = None
+        while True:
+            start = self._buffer.find(self.boundary)
+            if start < 0:
+                # keep only the tail that may contain the beginning of a boundary
+                del self._buffer[:max(0, len(self._buffer) - len(self.boundary))]
+                return latest
+            headers_end = self._buffer.find(b'\r\n\r\n', start)
+            if headers_end < 0:
+                del self._buffer[:start]
+                return latest
+            headers = bytes(self._buffer[start + len(self.boundary):headers_end]).decode('latin-1')
+            body_start = headers_end + 4
+            length = self._content_length(headers)
+            if length is not None:
+                body_end = body_start + length
+                if len(self._buffer) < body_end:
+                    del self._buffer[:start]
+                    return latest
+            else:
+                body_end = self._buffer.find(self.boundary, body_start)
+                if body_end < 0:
+                    del self._buffer[:start]
+                    return latest
+            latest = bytes(self._buffer[body_start:body_end]).rstrip(b'\r\n')
+            del self._buffer[:body_end]
+
+    @staticmethod
+    def _content_length(headers: str) -> int | None:
+        for line in headers.split('\r\n'):
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'content-length':
+                try:
+                    return int(value)
+                except ValueError:
+                    return None
+        return None
+
+
+def is_multipart(response: requests.Response) -> bool:
+    return response.headers.get('Content-Type', '').startswith('multipart/')
+
+
+def get_boundary(content_type: str) -> str:
+    for param in content_type.split(';')[1:]:
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'boundary':
+            return value.strip()
+    raise ValueError(f'No boundary in content type {content_type!r}')
+
+
+class MJPEGStream():
+    """
+    Persistent connection to MJPEG camera stream that keeps only the latest frame.
+
+    Frames are parsed in a background thread; older frames are dropped as soon
+    as a newer one is complete. Connection is reopened after errors.
+
+    Attributes:
+        url (str): link to camera stream
+        timeout (float): connect and read timeout in seconds
+        reconnect_delay (float): pause before reconnecting after error
+    """
+
+    def __init__(self, url: str, session: requests.Session | None = None,
+                 timeout: float = 5., reconnect_delay: float = 1.):
+        self.url = url
+        self.timeout = timeout
+        self.reconnect_delay = reconnect_delay
+        self.session = session or requests.Session()
+        self.logger = logging.getLogger(__name__)
+        self._frame: bytes | None = None
+        self._seq = 0
+        self._updated_at = 0.
+        self._cond = threading.Condition()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'mjpeg-{url}', daemon=True)
+        self._thread.start()
+
+    @property
+    def seq(self) -> int:
+        """Number of frames received so far"""
+        return self._seq
+
+    def latest(self, wait: float = 0., max_age: float | None = None) -> bytes | None:
+        """
+        Get the latest complete JPEG frame
+
+        Args:
+            wait (float): seconds to wait for the first frame if there is none yet
+            max_age (float | None): ignore frame older than this many seconds
+
+        Returns:
+            bytes | None: JPEG data or None if no suitable frame
+        """
+        with self._cond:
+            if self._frame is None and wait > 0:
+                self._cond.wait_for(lambda: self._frame is not None or self._closed.is_set(), wait)
+            if self._frame is None:
+                return None
+            if max_age is not None and monotonic() - self._updated_at > max_age:
+                return None
+            return self._frame
+
+    def next_frame(self, after: int, timeout: float | None = None) -> tuple[int, bytes | None]:
+        """
+        Wait for frame newer than given sequence number
+
+        Args:
+            after (int): sequence number of the last frame seen by caller
+            timeout (float | None): max time to wait in seconds
+
+        Returns:
+            tuple[int, bytes | None]: sequence number and frame (None on timeout)
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after or self._closed.is_set(), timeout)
+            if self._seq > after:
+                return self._seq, self._frame
+            return self._seq, None
+
+    def close(self):
+        """
+        Close connection and stop reader thread
+        """
+        self._closed.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def _run(self):
+        while not self._closed.is_set():
+            try:
+                self._read()
+            except Exception as exc:
+                self.logger.error('Camera stream %s failed: %s', self.url, exc)
+            self._closed.wait(self.reconnect_delay)
+
+    def _read(self):
+        with self.session.get(self.url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            parser = MultipartParser(get_boundary(response.headers.get('Content-Type', '')))
+            self.logger.debug('Connected to camera stream %s', self.url)
+            for chunk in response.iter_content(chunk_size=4096):
+                if self._closed.is_set():
+                    return
+                frame = parser.feed(chunk)
+                if frame:
+                    with self._cond:
+                        self._frame = frame
+                        self._seq += 1
+                        self._updated_at = monotonic()
+                        self._cond.notify_all()
@@ -0,0 +1,41 @@
+import numpy as np
+
+from cv.model import TILE_SIZE
+
+
+def split_tiles(img: np.ndarray) -> np.ndarray:
+    """
+    Split image into full TILE_SIZE x TILE_SIZE tiles without copying
+
+    Args:
+        img (np.ndarray): image array of shape (height, width, channels)
+
+    Returns:
+        np.ndarray: strided view of shape (rows, cols, TILE_SIZE, TILE_SIZE, channels)
+    """
+    N = TILE_SIZE
+    rows, cols = img.shape[0] // N, img.shape[1] // N
+    s0, s1, s2 = img.strides
+    tiles = np.lib.stride_tricks.as_strided(
+        img, shape=(rows, cols, N, N, img.shape[2]),
+        strides=(s0 * N, s1 * N, s0, s1, s2), writeable=False)
+    return tiles
+
+
+def frame_error(labels: np.ndarray, shape: tuple[int, ...]) -> int:
+    """
+    Decides error of the whole frame from classes of its tiles
+
+    Args:
+        labels (np.ndarray): classes of full tiles, 0 is no error
+        shape (tuple[int, ...]): frame shape, partial edge tiles count as tiles without error
+
+    Returns:
+        int: most common error class if it covers most of the frame, 0 otherwise
+    """
+    errors = labels[labels != 0]
+    total = -(-shape[0] // TILE_SIZE) * -(-shape[1] // TILE_SIZE)
+    # find most common error and check if it is not just noise
+    if not len(errors) or len(errors) / total <= 0.5:  # todo: check if this is good enough
+        return 0
+    return int(np.bincount(errors).argmax())
@@ -0,0 +1,201 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from cv.model import CHANNELS, MODEL_PATH, TILE_SIZE, TFLiteModelHandle, ModelHandle
+
+MAX_CLASSES = 16  # size of output buffer per tile, model has fewer classes
+
+
+class InferencePool():
+    """
+    Pool of worker processes running the model.
+
+    Every worker loads the model once and is limited to intra_op_threads
+    threads, so N workers use N * intra_op_threads cores without fighting for
+    them. Tiles and predictions are passed through shared memory blocks owned
+    by the pool, only their sizes go through the pipe.
+
+    Attributes:
+        model_path (str): path to saved model
+        workers (int): number of worker processes
+        intra_op_threads (int): threads of each worker runtime
+        max_tiles (int): max tiles a worker gets at once, bigger batches are split between workers
+    """
+
+    def __init__(self, model_path: str = MODEL_PATH, workers: int = 2, intra_op_threads: int = 1,
+                 max_tiles: int = 256):
+        self.model_path = model_path
+        self.workers = workers
+        self.intra_op_threads = intra_op_threads
+        self.max_tiles = max_tiles
+        self.logger = logging.getLogger(__name__)
+        # spawn: TensorFlow state of the parent must not be inherited
+        self._context = multiprocessing.get_context('spawn')
+        self._idle: queue.Queue[_Worker] = queue.Queue()
+        self._all: list[_Worker] = []
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='inference-pool')
+        for i in range(workers):
+            worker = _Worker(self, i)
+            self._all.append(worker)
+            self._idle.put(worker)
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        """
+        Runs model over tiles, splitting them between idle workers
+
+        Args:
+            x (np.ndarray): tiles of shape (n, TILE_SIZE, TILE_SIZE, CHANNELS)
+
+        Returns:
+            np.ndarray: model output of shape (n, classes)
+        """
+        chunk = min(self.max_tiles, -(-len(x) // self.workers))
+        parts = [x[begin:begin + chunk] for begin in range(0, len(x), chunk)]
+        if len(parts) == 1:
+            return self._run(parts[0])
+        outputs = list(self._executor.map(self._run, parts))
+        return np.concatenate(outputs)
+
+    def warm_up(self) -> list[dict]:
+        """
+        Waits until every worker has loaded the model and run a dummy batch
+
+        Returns:
+            list[dict]: load and warm-up timings of each worker
+        """
+        return list(self._executor.map(lambda worker: worker.timings, self._all))
+
+    def close(self):
+        """
+        Stops workers and frees shared memory
+        """
+        for worker in self._all:
+            worker.close()
+        self._executor.shutdown()
+
+    def _run(self, x: np.ndarray) -> np.ndarray:
+        worker = self._idle.get()
+        try:
+            return worker.predict(x)
+        finally:
+            self._idle.put(worker)
+
+
+class _Worker():
+    """
+    Parent side of one worker process with its shared memory blocks
+    """
+
+    def __init__(self, pool: InferencePool, number: int):
+        self.pool = pool
+        self.number = number
+        self.inputs = SharedMemory(create=True, size=pool.max_tiles * TILE_SIZE * TILE_SIZE * CHANNELS * 4)
+        self.outputs = SharedMemory(create=True, size=pool.max_tiles * MAX_CLASSES * 4)
+        self.process = None
+        self.conn: Connection | None = None
+        self._timings: dict | None = None
+        self._lock = threading.Lock()
+        self._start()
+
+    @property
+    def timings(self) -> dict:
+        with self._lock:
+            try:
+                self._wait_ready()
+            except (EOFError, OSError) as exc:
+                self._restart(exc)
+            return self._timings
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        with self._lock:
+            try:
+                self._wait_ready()
+                np.ndarray(x.shape, np.float32, self.inputs.buf)[:] = x
+                self.conn.send(len(x))
+                reply = self.conn.recv()
+            except (EOFError, OSError) as exc:
+                self._restart(exc)
+            if isinstance(reply, str):
+                raise RuntimeError(f'Inference worker {self.number} failed: {reply}')
+            return np.ndarray(reply, np.float32, self.outputs.buf).copy()
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.inputs.close()
+        self.inputs.unlink()
+        self.outputs.close()
+        self.outputs.unlink()
+
+    def _start(self):
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+        parent, child = self.pool._context.Pipe()
+        self.process = self.pool._context.Process(
+            target=_worker_main, name=f'inference-worker-{self.number}', daemon=True,
+            args=(self.pool.model_path, self.pool.intra_op_threads, self.pool.max_tiles,
+                  self.inputs.name, self.outputs.name, child))
+        self.process.start()
+        child.close()
+        self.conn = parent
+        self._timings = None
+
+    def _restart(self, exc: Exception):
+        # the next call waits for the new process, this one fails
+        self.pool.logger.error('Inference worker %d died: %s', self.number, exc)
+        self._start()
+        raise RuntimeError(f'Inference worker {self.number} died') from exc
+
+    def _wait_ready(self):
+        if self._timings is None:
+            reply = self.conn.recv()
+            if isinstance(reply, str):
+                raise RuntimeError(f'Inference worker {self.number} failed to start: {reply}')
+            self._timings = reply
+            self.pool.logger.info('Inference worker %d ready: %s', self.number, reply)
+
+
+def _worker_main(model_path: str, threads: int, max_tiles: int, inputs_name: str, outputs_name: str,
+                 conn: Connection):
+    # math libraries read thread limits on import
+    os.environ['OMP_NUM_THREADS'] = os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    inputs = SharedMemory(inputs_name)
+    outputs = SharedMemory(outputs_name)
+    try:
+        handle = (TFLiteModelHandle if model_path.endswith('.tflite') else ModelHandle)(model_path, threads)
+        conn.send(handle.warm_up(min(max_tiles, 64)))
+    except Exception as exc:
+        conn.send(str(exc))
+        return
+    while True:
+        try:
+            size = conn.recv()
+        except EOFError:
+            break
+        if size is None:
+            break
+        try:
+            x = np.ndarray((size, TILE_SIZE, TILE_SIZE, CHANNELS), np.float32, inputs.buf)
+            y = handle.predict(x, max_tiles)
+            del x
+            np.ndarray(y.shape, np.float32, outputs.buf)[:] = y
+            conn.send(y.shape)
+        except Exception as exc:
+            conn.send(str(exc))
+    inputs.close()
+    outputs.close()
@@ -1 +1,2 @@
 from printer.printer import Ultimaker
+from printer.async_printer import AsyncUltimaker
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+
+import httpx
+from requests.auth import HTTPDigestAuth
+
+
+class AsyncUltimaker():
+    """
+    Asyncio counterpart of Ultimaker: same methods, but every API call is a coroutine.
+
+    Several instances may share one httpx.AsyncClient, so status of many printers
+    can be gathered concurrently over a common connection pool.
+    """
+
+    def __init__(self, ip: str, username: str = "Test", credentials: dict | HTTPDigestAuth | None = None, request_timeout: float = 5, client: httpx.AsyncClient | None = None, pool_size: int = 4):
+        self.__ip = ip
+        self.__api_url = "http://" + self.__ip + "/api/v1/"
+        self.__cluster_url = "http://" + self.__ip + "/cluster-api/v1/"
+        self.__username = username
+        self.__app_name = "Test"
+        self.__heads_count = 1
+        self.__extruders_count = 2
+        self.__own_client = client is None
+        self.__client = client or httpx.AsyncClient(
+            timeout=request_timeout, limits=httpx.Limits(max_keepalive_connections=pool_size, max_connections=pool_size))
+        # unlike timeout of Ultimaker, this limits every API call, registration waits in authorize
+        self.__timeout = httpx.Timeout(request_timeout)
+        self.logger = logging.getLogger(__name__)
+        # credentials are kept here: httpx.DigestAuth does not expose them
+        self.__credentials = None
+        if isinstance(credentials, dict):
+            self.__credentials = dict(zip(("id", "key"), credentials.values()))
+        elif isinstance(credentials, HTTPDigestAuth):
+            # e.g. auth of Ultimaker for the same printer
+            self.__credentials = {"id": credentials.username, "key": credentials.password}
+        self.auth = httpx.DigestAuth(*self.__credentials.values()) if self.__credentials else None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self) -> None:
+        """
+        Closes connection pool if it is owned by this instance
+        """
+        if self.__own_client:
+            await self.__client.aclose()
+
+    async def __request(self, method: str, url: str, auth: bool = True, **kwargs) -> httpx.Response:
+        if auth and self.auth is None:
+            await self.authorize()
+        return await self.__client.request(
+            method, url, auth=self.auth if auth else None, timeout=self.__timeout, **kwargs)
+
+    async def __get_credentials(self) -> dict:
+        data = await self.__request(
+            "POST", self.__api_url + "auth/request", auth=False,
+            data={"application": self.__app_name, "user": self.__username})
+        return data.json()
+
+    async def __check_auth(self, user_id: int | str) -> bool:
+        data = await self.__request("GET", self.__api_url + f"auth/check/{user_id}")
+        return data.json()["message"] == "authorized"
+
+    async def authorize(self, timeout: float = 0) -> bool:
+        """
+        Requests new credentials if there are none and waits until they are authorized
+
+        Args:
+            timeout (float): how long to wait for authorization on the printer, seconds
+
+        Returns:
+            bool: True if credentials are authorized
+        """
+        if self.auth is None:
+            self.__credentials = await self.__get_credentials()
+            self.auth = httpx.DigestAuth(*self.__credentials.values())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            if await self.__check_auth(self.__credentials["id"]):
+                return True
+            if loop.time() >= deadline:
+                return False
+            await asyncio.sleep(1)
+
+    def get_credentials(self) -> dict | None:
+        return self.__credentials
+
+    async def put_printer_led(self, brightness: float, saturation: float, hue: float) -> None:
+        if brightness < 0 or brightness > 100:
+            raise ValueError("Brightness is out of range")
+        if saturation < 0 or saturation > 100:
+            raise ValueError("Saturation is out of range")
+        if hue < 0 or hue > 360:
+            raise ValueError("Hue is out of range")
+        data = await self.__request(
+            "PUT", self.__api_url + "printer/led",
+            json={"brightness": brightness, "saturation": saturation, "hue": hue})
+        self.logger.debug('put_printer_led: %d | %s', data.status_code, data.text)
+        if data.status_code != 204:
+            raise Exception("Error while changing LED color")
+
+    async def get_printer(self) -> dict:
+        return (await self.__request("GET", self.__api_url + "printer")).json()
+
+    async def post_printer_led_blink(self, frequency: float, count: int) -> None:
+        if frequency < 0.1 or frequency > 100:
+            raise ValueError("Frequency is out of range")
+        if count < 1 or count > 1000:
+            raise ValueError("Count is out of range")
+        data = await self.__request(
+            "POST", self.__api_url + "printer/led/blink",
+            json={"frequency": frequency, "count": count})
+        if data.status_code != 204:
+            raise Exception("Error while blinking LED")
+
+    #!fixme throws "405: Method not allowed"
+    async def put_printer_heads_position(self, head_id: int, x: float, y: float, z: float) -> None:
+        if head_id >= self.__heads_count:
+            raise ValueError("head_id is out of range")
+        data = await self.__request(
+            "PUT", self.__api_url + "printer/heads/" + str(head_id) + "/position",
+            json={"x": x, "y": y, "z": z})
+        if data.status_code != 204:
+            raise Exception("Error while changing position")
+
+    #!fixme throws "405: Method not allowed"
+    async def put_printer_bed_temperature(self, temperature: float) -> None:
+        data = await self.__request(
+            "PUT", self.__api_url + "printer/bed/temperature",
+            json={"temperature": temperature})
+        self.logger.debug('put_printer_bed_temperature: %d | %s', data.status_code, data.text)
+        if data.status_code == 405:
+            raise Exception("Method not allowed")
+
+    async def put_printer_bed_pre_heat(self, temperature: float, timeout: int) -> None:
+        if temperature < 0 or temperature > 100:
+            raise ValueError("Temperature is out of range")
+        if timeout < 60 or timeout > 60*60:
+            raise ValueError("Timeout is out of range")
+        data = await self.__request(
+            "PUT", self.__api_url + "printer/bed/pre_heat",
+            json={"temperature": temperature, "timeout": timeout})
+        self.logger.debug('put_printer_bed_pre_heat: %d | %s', data.status_code, data.text)
+        if data.status_code == 400:
+            raise Exception("Error while preheating bed")
+
+    async def set_bed_temperature(self, temperature: float) -> bool:
+        if not await self.get_print_jobs():
+            await self.put_printer_bed_pre_heat(temperature, 60*10)
+            await self.put_printer_led(50, 100, 30)
+            return True
+        return False
+
+    #!fixme throws "405: Method not allowed"
+    async def put_printer_heads_extruders_hotend_temperature(self, head_id: int, extruder_id: int, temperature: float) -> None:
+        if head_id >= self.__heads_count:
+            raise ValueError("head_id is out of range")
+        if extruder_id >= self.__extruders_count:
+            raise ValueError("extruder_id is out of range")
+        data = await self.__request(
+            "PUT", self.__api_url + "printer/heads/" + str(head_id) + "/extruders/" +
+            str(extruder_id) + "/hotend/temperature",
+            json={"temperature": temperature})
+        self.logger.debug('put_printer_heads_extruders_hotend_temperature: %d | %s', data.status_code, data.text)
+
+    async def post_printer_beep(self, frequency: float, duration: float) -> None:
+        if frequency < 0.1 or frequency > 100:
+            raise ValueError("Frequency is out of range")
+        if duration < 0 or duration > 100:
+            raise ValueError("Duration is out of range")
+        data = await self.__request(
+            "POST", self.__api_url + "printer/beep",
+            json={"frequency": frequency, "duration": duration})
+        self.logger.debug('post_printer_beep: %d | %s', data.status_code, data.text)
+        if data.status_code == 400:
+            raise ValueError("Unable to beep due to missing parameters")
+        if data.status_code != 204:
+            raise Exception("Error while beeping")
+
+    async def get_print_job(self) -> dict:
+        data = await self.__request("GET", self.__api_url + "print_job")
+        self.logger.debug('get_print_job: %d | %s', data.status_code, data.text)
+        return data.json()
+
+    async def post_print_job(self, jobname: str, file: str) -> dict:
+        with open(file, "rb") as f:
+            data = await self.__request(
+                "POST", self.__api_url + "print_job",
+                data={"jobname": jobname}, files={"file": f})
+        return data.json()
+
+    async def get_print_jobs(self) -> list[dict]:
+        data = await self.__request("GET", self.__cluster_url + "print_jobs", auth=False)
+        self.logger.debug('get_print_jobs: %d | %s', data.status_code, data.text)
+        return data.json()
+
+    async def set_print_job_state(self, state: str, job_uuid: str | None = None) -> bool:
+        if state not in ["print", "pause", "abort"]:
+            raise ValueError("State must be 'print', 'pause' or 'abort'")
+        if job_uuid is None:
+            job_uuid = (await self.get_print_jobs())[0]["uuid"]
+        data = await self.__request(
+            "POST", self.__cluster_url + "print_jobs/" + job_uuid + "/action",
+            json={"action": state})
+        self.logger.debug('set_print_job_state: %d | %s', data.status_code, data.text)
+        return True
+
+    async def get_system(self) -> dict:
+        return (await self.__request("GET", self.__api_url + "system")).json()
+
+    async def put_system_display_message(self, message: str, button_caption: str) -> None:
+        data = (await self.__request(
+            "PUT", self.__api_url + "system/display_message",
+            json={"message": message, "button_caption": button_caption})).json()
+        if data["message"] != "ok":
+            raise Exception("Failed to display message")
+
+    async def get_camera_feed(self) -> dict:
+        return (await self.__request("GET", self.__api_url + "camera")).json()
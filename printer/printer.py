@@ -1,17 +1,25 @@
 import logging
+import threading
+from concurrent.futures import Future
 from datetime import datetime
-from time import sleep, time
+from time import time
+from typing import BinaryIO, Callable
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPDigestAuth
 
+from printer.upload import MultipartUpload
+
+UPLOAD_MIN_SPEED = 50 * 1024  # bytes per second, slowest expected upload, sets read timeout of big files
+
 
 class Ultimaker():
     """
     Class implements local API of Ultimaker 3 printer.
     """
 
-    def __init__(self, ip: str, username: str = "Test", credentials: dict | HTTPDigestAuth | None = None, auto_register: bool = True, timeout: int = 60):
+    def __init__(self, ip: str, username: str = "Test", credentials: dict | HTTPDigestAuth | None = None, auto_register: bool = True, timeout: int = 60, pool_size: int = 4):
         self.__ip = ip
         self.__api_url = "http://" + self.__ip + "/api/v1/"
         self.__cluster_url = "http://" + self.__ip + "/cluster-api/v1/"
@@ -21,25 +29,79 @@ class Ultimaker():
         self.__heads_count = 1
         self.__extruders_count = 2
         self.logger = logging.getLogger(__name__)
-        begin = time()
-        REG_TIMEOUT = timeout
+        # keep-alive connections; digest auth reuses server nonce for next requests
+        self.__session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.__session.mount("http://", adapter)
+        self.__registration_timeout = timeout
+        self.__auto_register = auto_register
+        self.__registration: Future | None = None
+        self.__auth_lock = threading.Lock()
+        self.__closed = threading.Event()
         if isinstance(credentials, dict):
-            self.auth = HTTPDigestAuth(*credentials.values())
+            self.__auth = HTTPDigestAuth(*credentials.values())
         elif isinstance(credentials, HTTPDigestAuth):
-            self.auth = credentials
+            self.__auth = credentials
         else:
-            self.auth = HTTPDigestAuth(*self.__get_credentials().values())
-        while time() - begin < REG_TIMEOUT:
-            if self.__check_auth(self.auth.username):
-                break
-            sleep(1)
-        if time() >= begin + REG_TIMEOUT and not auto_register:
-            raise TimeoutError("Registration timeout")
-        if time() >= begin + REG_TIMEOUT and auto_register:
-            self.auth = HTTPDigestAuth(*self.__get_credentials().values())
+            self.__auth = None
+
+    @property
+    def auth(self) -> HTTPDigestAuth:
+        """
+        Digest credentials of the application.
+
+        Nothing is sent to the printer on construction: credentials are requested
+        on first access if they were not given, and their registration is checked
+        in background (see register).
+        """
+        with self.__auth_lock:
+            if self.__auth is None:
+                self.__auth = HTTPDigestAuth(*self.__get_credentials().values())
+            auth = self.__auth
+        self.register()
+        return auth
+
+    def register(self) -> Future:
+        """
+        Starts background polling of registration status if it is not started yet.
+
+        New credentials must be confirmed on the printer; if this does not happen
+        within timeout, new credentials are requested (auto_register) or
+        TimeoutError is set on the handle. Polling is cancelled by close.
+
+        Returns:
+            Future: resolves to True when credentials are authorized, False if they
+            were replaced; use asyncio.wrap_future to await it
+        """
+        with self.__auth_lock:
+            if self.__registration is None:
+                self.__registration = Future()
+                threading.Thread(target=self.__register, args=(self.__registration,),
+                                 name=f"ultimaker-register-{self.__ip}", daemon=True).start()
+            return self.__registration
+
+    def __register(self, registration: Future):
+        try:
+            begin = time()
+            while time() - begin < self.__registration_timeout:
+                if self.__check_auth(self.__auth.username):
+                    registration.set_result(True)
+                    return
+                if self.__closed.wait(1):
+                    registration.cancel()
+                    return
+            if not self.__auto_register:
+                raise TimeoutError("Registration timeout")
+            auth = HTTPDigestAuth(*self.__get_credentials().values())
+            with self.__auth_lock:
+                self.__auth = auth
+            registration.set_result(False)
+        except Exception as exc:
+            self.logger.error('Registration on %s failed: %s', self.__ip, exc)
+            registration.set_exception(exc)
 
     def __get_credentials(self):
-        return requests.post(
+        return self.__session.post(
             url=self.__api_url + "auth/request",
             data={"application": self.__app_name, "user": self.__username},
             timeout=self.__timeout
@@ -48,9 +110,9 @@ class Ultimaker():
     def __check_auth(self, user_id: int | str):
         if isinstance(user_id, int):
             user_id = str(user_id)
-        data = requests.get(
+        data = self.__session.get(
             url=self.__api_url + f"auth/check/{user_id}",
-            auth=self.auth,
+            auth=self.__auth,
             timeout=self.__timeout
         ).json()
         if data["message"] == "authorized":
@@ -60,6 +122,13 @@ class Ultimaker():
     def get_credentials(self) -> dict:
         return {"id": self.auth.username, "key": self.auth.password}
 
+    def close(self) -> None:
+        """
+        Closes pooled connections to the printer and stops registration polling
+        """
+        self.__closed.set()
+        self.__session.close()
+
     def put_printer_led(self, brightness: float, saturation: float, hue: float) -> None:
         """
         Sets printer LED color
@@ -81,7 +150,7 @@ class Ultimaker():
             raise ValueError("Saturation is out of range")
         if hue < 0 or hue > 360:
             raise ValueError("Hue is out of range")
-        data = requests.put(
+        data = self.__session.put(
             url=self.__api_url + "printer/led",
             auth=self.auth,
             json={"brightness": brightness,
@@ -93,7 +162,7 @@ class Ultimaker():
             raise Exception("Error while changing LED color")
 
     def get_printer(self) -> dict:
-        return requests.get(
+        return self.__session.get(
             url=self.__api_url + "printer",
             auth=self.auth,
             timeout=self.__timeout
@@ -104,7 +173,7 @@ class Ultimaker():
             raise ValueError("Frequency is out of range")
         if count < 1 or count > 1000:
             raise ValueError("Count is out of range")
-        data = requests.post(
+        data = self.__session.post(
             url=self.__api_url + "printer/led/blink",
             auth=self.auth,
             json={"frequency": frequency, "count": count},
@@ -117,7 +186,7 @@ class Ultimaker():
     def put_printer_heads_position(self, head_id: int, x: float, y: float, z: float) -> None:
         if head_id >= self.__heads_count:
             raise ValueError("head_id is out of range")
-        data = requests.put(
+        data = self.__session.put(
             url=self.__api_url + "printer/heads/" + str(head_id) + "/position",
             auth=self.auth,
             json={"x": x, "y": y, "z": z},
@@ -128,7 +197,7 @@ class Ultimaker():
 
     #!fixme throws "405: Method not allowed"
     def put_printer_bed_temperature(self, temperature: float) -> None:
-        data = requests.put(
+        data = self.__session.put(
             url=self.__api_url + "printer/bed/temperature",
             auth=self.auth,
             json={"temperature": temperature},
@@ -143,7 +212,7 @@ class Ultimaker():
             raise ValueError("Temperature is out of range")
         if timeout < 60 or timeout > 60*60:
             raise ValueError("Timeout is out of range")
-        data = requests.put(
+        data = self.__session.put(
             url=self.__api_url + "printer/bed/pre_heat",
             auth=self.auth,
             json={"temperature": temperature, "timeout": timeout},
@@ -167,7 +236,7 @@ class Ultimaker():
             raise ValueError("head_id is out of range")
         if extruder_id >= self.__extruders_count:
             raise ValueError("extruder_id is out of range")
-        data = requests.put(
+        data = self.__session.put(
             url=self.__api_url + "printer/heads/" +
             str(head_id) + "/extruders/" +
             str(extruder_id) + "/hotend/temperature",
@@ -182,7 +251,7 @@ class Ultimaker():
             raise ValueError("Frequency is out of range")
         if duration < 0 or duration > 100:
             raise ValueError("Duration is out of range")
-        data = requests.post(
+        data = self.__session.post(
             url=self.__api_url + "printer/beep",
             auth=self.auth,
             json={"frequency": frequency, "duration": duration},
@@ -195,7 +264,7 @@ class Ultimaker():
             raise Exception("Error while beeping")
 
     def get_print_job(self) -> dict:
-        data = requests.get(
+        data = self.__session.get(
             url=self.__api_url + "print_job",
             auth=self.auth,
             timeout=self.__timeout
@@ -203,30 +272,67 @@ class Ultimaker():
         self.logger.debug('get_print_job: %d | %s', data.status_code, data.json())
         return data.json()
 
-    def post_print_job(self, jobname: str, file: str) -> dict:
-        return requests.post(
+    def post_print_job(self, jobname: str, file: str | BinaryIO, progress: Callable[[int, int], None] | None = None, filename: str | None = None) -> dict:
+        """
+        Uploads G-code file and starts printing it
+
+        File is streamed to the printer in chunks, read timeout grows with file size
+
+        Args:
+            jobname (str): name of print job
+            file (str | BinaryIO): path to file or seekable binary file object
+            progress (Callable[[int, int], None] | None): called with sent and total bytes during upload
+            filename (str | None): file name shown on the printer, name of file by default
+
+        Returns:
+            dict: printer response
+        """
+        if isinstance(file, str):
+            with open(file, "rb") as f:
+                return self.post_print_job(jobname, f, progress, filename)
+        # digest challenge is answered before the body is sent, not after
+        self.__session.get(url=self.__api_url + "auth/verify", auth=self.auth, timeout=self.__timeout)
+        body = MultipartUpload({"jobname": jobname}, "file", file,
+                               filename or getattr(file, "name", None) or jobname + ".gcode", progress)
+        data = self.__session.post(
             url=self.__api_url + "print_job",
             auth=self.auth,
-            json={"jobname": jobname},
-            files={"file": open(file, "rb")},
-            timeout=self.__timeout
-        ).json()
+            data=body,
+            headers={"Content-Type": body.content_type},
+            timeout=(self.__timeout, self.__timeout + body.file_size / UPLOAD_MIN_SPEED)
+        )
+        self.logger.debug('post_print_job: %d | %s', data.status_code, data.text)
+        return data.json()
     
     def get_print_jobs(self) -> list[dict]:
-        data = requests.get(
+        data = self.__session.get(
             url=self.__cluster_url + "print_jobs",
             timeout=self.__timeout
         )
         self.logger.debug('get_print_jobs: %d | %s', data.status_code, data.json())
         return data.json()
 
-    def set_print_job_state(self, state: str) -> bool:
+    def set_print_job_state(self, state: str, job_uuid: str | None = None) -> bool:
+        """
+        Sends action to current print job
+
+        Args:
+            state (str): 'print', 'pause' or 'abort'
+            job_uuid (str | None): uuid of current print job, e.g. from cached /print_job, fetched if not given
+
+        Raises:
+            ValueError: if state is unknown
+
+        Returns:
+            bool: True
+        """
         if state not in ["print", "pause", "abort"]:
             raise ValueError("State must be 'print', 'pause' or 'abort'")
-        job = self.get_print_jobs()[0]
+        if job_uuid is None:
+            job_uuid = self.get_print_jobs()[0]["uuid"]
         # todo: отслеживание несоответствия текущего состояния и запрошенного
-        data = requests.post(
-            url=self.__cluster_url + "print_jobs/" + job["uuid"] + "/action",
+        data = self.__session.post(
+            url=self.__cluster_url + "print_jobs/" + job_uuid + "/action",
             auth=self.auth,
             json={"action": state},
             timeout=self.__timeout
@@ -235,14 +341,14 @@ class Ultimaker():
         return True
 
     def get_system(self) -> dict:
-        return requests.get(
+        return self.__session.get(
             url=self.__api_url + "system",
             auth=self.auth,
             timeout=self.__timeout
         ).json()
 
     def put_system_display_message(self, message: str, button_caption: str) -> None:
-        data = requests.put(
+        data = self.__session.put(
             url=self.__api_url + "system/display_message",
             auth=self.auth,
             json={"message": message, "button_caption": button_caption},
@@ -252,7 +358,7 @@ class Ultimaker():
             raise Exception("Failed to display message")
 
     def get_camera_feed(self) -> dict:
-        return requests.get(
+        return self.__session.get(
             url=self.__api_url + "camera",
             auth=self.auth,
             timeout=self.__timeout
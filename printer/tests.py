@@ -0,0 +1,179 @@
+import email
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from requests.auth import HTTPDigestAuth
+
+from printer import AsyncUltimaker, Ultimaker
+from printer.upload import MultipartUpload
+
+CREDENTIALS = {'id': 'app-id', 'key': 'app-key'}
+REALM = 'Jedi-API'
+NONCE = 'fake-nonce'
+
+
+def _md5(*parts: str) -> str:
+    return hashlib.md5(':'.join(parts).encode()).hexdigest()
+
+
+class FakeUltimakerHandler(BaseHTTPRequestHandler):
+    """
+    Local API of Ultimaker with digest authentication, only the calls used in tests
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path == '/api/v1/auth/request':
+            self.server.registrations += 1
+            return self._reply(200, CREDENTIALS)
+        if not self._authorized():
+            return self._reply(401, {'message': 'Authorization required'},
+                               {'WWW-Authenticate': f'Digest realm="{REALM}", nonce="{NONCE}", qop="auth"'})
+        if self.path == f'/api/v1/auth/check/{CREDENTIALS["id"]}':
+            return self._reply(200, {'message': 'authorized'})
+        if self.path == '/api/v1/printer':
+            return self._reply(200, {'status': 'idle'})
+        if self.path == '/api/v1/print_job' and self.command == 'POST':
+            self.server.uploads.append((self.headers.get('Content-Length'), self.headers.get('Transfer-Encoding')))
+            if self.server.stale_nonces:
+                # e.g. nonce expired on the printer, client must send the whole body again
+                self.server.stale_nonces -= 1
+                return self._reply(401, {'message': 'Authorization required'},
+                                   {'WWW-Authenticate': f'Digest realm="{REALM}", nonce="{NONCE}", qop="auth"'})
+            message = email.message_from_bytes(
+                b'Content-Type: ' + self.headers['Content-Type'].encode() + b'\r\n\r\n' + body)
+            fields = {part.get_param('name', header='content-disposition'): part for part in message.get_payload()}
+            self.server.jobs.append((fields['jobname'].get_payload(decode=True).decode(), fields['file'].get_filename(),
+                                     fields['file'].get_payload(decode=True)))
+            return self._reply(201, {'message': 'Print job started'})
+        self._reply(404, {'message': 'Not found'})
+
+    def _authorized(self) -> bool:
+        header = self.headers.get('Authorization', '')
+        if not header.startswith('Digest '):
+            return False
+        fields = dict(re.findall(r'(\w+)="?([^",]*)"?', header[len('Digest '):]))
+        if fields.get('username') != CREDENTIALS['id'] or fields.get('nonce') != NONCE:
+            return False
+        ha1 = _md5(CREDENTIALS['id'], REALM, CREDENTIALS['key'])
+        ha2 = _md5(self.command, fields['uri'])
+        return fields.get('response') == _md5(ha1, NONCE, fields['nc'], fields['cnonce'], 'auth', ha2)
+
+    def _reply(self, status: int, data: dict, headers: dict | None = None):
+        content = json.dumps(data).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def _start_server(test: TestCase) -> str:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeUltimakerHandler)
+    server.jobs, server.uploads, server.registrations, server.stale_nonces = [], [], 0, 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    test.server = server
+    return '%s:%d' % server.server_address
+
+
+class AsyncUltimakerTests(IsolatedAsyncioTestCase):
+    """
+    AsyncUltimaker against a local fake printer
+    """
+
+    def setUp(self):
+        self.address = _start_server(self)
+
+    async def test_status_requests_credentials_once(self):
+        async with AsyncUltimaker(self.address) as printer:
+            self.assertEqual(await printer.get_printer(), {'status': 'idle'})
+            self.assertEqual(await printer.get_printer(), {'status': 'idle'})
+            self.assertEqual(printer.get_credentials(), CREDENTIALS)
+        self.assertEqual(self.server.registrations, 1)
+
+    async def test_given_credentials(self):
+        for credentials in (CREDENTIALS, HTTPDigestAuth(CREDENTIALS['id'], CREDENTIALS['key'])):
+            async with AsyncUltimaker(self.address, credentials=credentials) as printer:
+                self.assertEqual(printer.get_credentials(), CREDENTIALS)
+                self.assertTrue(await printer.authorize())
+                self.assertEqual(await printer.get_printer(), {'status': 'idle'})
+        self.assertEqual(self.server.registrations, 0)
+
+    async def test_post_print_job(self):
+        with tempfile.NamedTemporaryFile('wb', suffix='.gcode', delete=False) as f:
+            f.write(b'G28\nG1 X10 Y10\n')
+        self.addCleanup(os.remove, f.name)
+        async with AsyncUltimaker(self.address, credentials=CREDENTIALS) as printer:
+            self.assertEqual(await printer.post_print_job('cube', f.name), {'message': 'Print job started'})
+        self.assertEqual(self.server.jobs, [('cube', os.path.basename(f.name), b'G28\nG1 X10 Y10\n')])
+
+
+class MultipartUploadTests(TestCase):
+    """
+    Streamed G-code upload: exact length in advance and a body that can be sent again
+    """
+
+    def setUp(self):
+        self.file = tempfile.TemporaryFile()
+        self.addCleanup(self.file.close)
+        self.gcode = b'G28\n' + b'G1 X10 Y10\n' * 1000
+        self.file.write(b'; header\n' + self.gcode)
+        self.file.seek(len(b'; header\n'))
+
+    def test_length_and_body(self):
+        progress = []
+        body = MultipartUpload({'jobname': 'cube'}, 'file', self.file, '/tmp/cube.gcode',
+                               lambda sent, total: progress.append((sent, total)), chunk_size=1024)
+        data = b''.join(body)
+        self.assertEqual(len(body), len(data))
+        self.assertEqual(body.file_size, len(self.gcode))
+        self.assertEqual(progress[-1], (len(data), len(data)))
+        message = email.message_from_bytes(b'Content-Type: ' + body.content_type.encode() + b'\r\n\r\n' + data)
+        jobname, file = message.get_payload()
+        self.assertEqual(jobname.get_payload(), 'cube')
+        self.assertEqual(file.get_filename(), 'cube.gcode')
+        # file is sent from its position at construction
+        self.assertEqual(file.get_payload(decode=True), self.gcode)
+
+    def test_rewind(self):
+        body = MultipartUpload({'jobname': 'cube'}, 'file', self.file, 'cube.gcode', chunk_size=1024)
+        data = b''.join(body)
+        self.assertEqual(body.read(), b'')
+        for position in (0, 10, len(data) - 10):
+            self.assertEqual(body.seek(position), position)
+            self.assertEqual(body.tell(), position)
+            self.assertEqual(body.read(), data[position:])
+
+    def test_digest_retry_sends_whole_body(self):
+        address = _start_server(self)
+        self.server.stale_nonces = 1
+        printer = Ultimaker(address, credentials=CREDENTIALS, auto_register=False)
+        self.addCleanup(printer.close)
+        self.file.seek(0)
+        self.assertEqual(printer.post_print_job('cube', self.file, filename='cube.gcode'),
+                         {'message': 'Print job started'})
+        self.assertEqual(self.server.jobs, [('cube', 'cube.gcode', b'; header\n' + self.gcode)])
+        # both attempts are sent with Content-Length, not chunked
+        self.assertEqual(len(self.server.uploads), 2)
+        self.assertEqual(self.server.uploads[0], self.server.uploads[1])
+        self.assertIsNone(self.server.uploads[0][1])
@@ -0,0 +1,114 @@
+import os
+import uuid
+from typing import BinaryIO, Callable
+
+CHUNK_SIZE = 64 * 1024  # bytes read from file at once
+
+
+class MultipartUpload():
+    """
+    Streamed multipart/form-data body with one file.
+
+    The body is produced chunk by chunk while requests sends it, so the file is
+    never loaded into memory. Length is known in advance, so the request has a
+    Content-Length header, and the body can be rewound if the printer asks to
+    repeat the request (digest authentication).
+
+    Attributes:
+        content_type (str): value of Content-Type header with the boundary
+        sent (int): bytes of the body already read
+    """
+
+    def __init__(self, fields: dict, name: str, file: BinaryIO, filename: str,
+                 progress: Callable[[int, int], None] | None = None, chunk_size: int = CHUNK_SIZE):
+        """
+        Args:
+            fields (dict): plain form fields sent before the file
+            name (str): form field of the file
+            file (BinaryIO): seekable binary file, read from its current position
+            filename (str): file name sent to the server
+            progress (Callable[[int, int], None] | None): called with sent and total bytes after each chunk
+            chunk_size (int): max bytes read from file at once
+        """
+        boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+        head = b''.join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode()
+            for key, value in fields.items())
+        head += f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; ' \
+            f'filename="{os.path.basename(filename)}"\r\n' \
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode()
+        self.__head = head
+        self.__tail = f'\r\n--{boundary}--\r\n'.encode()
+        self.__file = file
+        self.__start = file.tell()
+        self.__size = file.seek(0, os.SEEK_END) - self.__start
+        self.__length = len(self.__head) + self.__size + len(self.__tail)
+        self.__progress = progress
+        self.__chunk_size = chunk_size
+        self.sent = 0
+        self.seek(0)
+
+    def __len__(self) -> int:
+        return self.__length
+
+    def __iter__(self):
+        while chunk := self.read(self.__chunk_size):
+            yield chunk
+
+    @property
+    def file_size(self) -> int:
+        """Size of the file part in bytes"""
+        return self.__size
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Reads next part of the body
+
+        Args:
+            size (int): max number of bytes, the rest of the body if negative
+
+        Returns:
+            bytes: next part of the body, empty at the end
+        """
+        if size < 0:
+            size = self.__length
+        chunks = []
+        while size > 0 and self.sent < self.__length:
+            head_end = len(self.__head)
+            file_end = head_end + self.__size
+            if self.sent < head_end:
+                chunk = self.__head[self.sent:self.sent + size]
+            elif self.sent < file_end:
+                chunk = self.__file.read(min(size, self.__chunk_size, file_end - self.sent))
+                if not chunk:
+                    raise IOError('File is shorter than expected')
+            else:
+                chunk = self.__tail[self.sent - file_end:self.sent - file_end + size]
+            chunks.append(chunk)
+            self.sent += len(chunk)
+            size -= len(chunk)
+        if chunks and self.__progress:
+            self.__progress(self.sent, self.__length)
+        return b''.join(chunks)
+
+    def tell(self) -> int:
+        return self.sent
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        """
+        Rewinds body, only used to repeat the request
+
+        Args:
+            offset (int): new position from the start of the body
+            whence (int): only os.SEEK_SET is supported
+
+        Returns:
+            int: new position
+        """
+        if whence != os.SEEK_SET:
+            raise ValueError('Only absolute seek is supported')
+        self.sent = offset
+        head_end = len(self.__head)
+        self.__file.seek(self.__start + min(max(offset - head_end, 0), self.__size))
+        return self.sent
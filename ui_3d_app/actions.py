@@ -0,0 +1,141 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from time import monotonic
+
+from ui_3d_app.logsink import sink
+from ui_3d_app.models import Printers
+from ui_3d_app.telemetry import poller
+from ui_3d_app.utils import get_printer
+
+ACTION_WORKERS = 32  # max printer requests running at the same time
+ACTION_DEADLINE = 10  # seconds to wait for all printers together
+PREHEAT_DURATION = 10 * 60  # seconds the bed is kept warm by preheat
+
+# print job action and LED color (brightness, saturation, hue) set with it
+JOB_ACTIONS = {
+    'pause': ('pause', (100, 100, 60)),
+    'resume': ('print', (100, 100, 120)),
+    'abort': ('abort', (100, 100, 0)),
+}
+
+ACTION_LABELS = {
+    'pause': 'Пауза',
+    'resume': 'Продолжить',
+    'abort': 'Отмена',
+    'led': 'Подсветка',
+    'preheat': 'Подогрев стола',
+}
+
+# numeric parameters each action takes
+ACTION_PARAMS = {
+    'pause': (),
+    'resume': (),
+    'abort': (),
+    'led': ('brightness', 'saturation', 'hue'),
+    'preheat': ('temperature',),
+}
+
+logger = logging.getLogger(__name__)
+_executor = ThreadPoolExecutor(max_workers=ACTION_WORKERS, thread_name_prefix='actions')
+
+
+@dataclass
+class ActionResult():
+    """
+    Result of an action on one printer
+
+    Attributes:
+        printer_id (int): printer id in database
+        name (str): printer name
+        ok (bool): whether all requests of the action succeeded
+        error (str): error of the first failed request, empty on success
+        elapsed (float): seconds until the last request finished
+    """
+    printer_id: int
+    name: str
+    ok: bool = True
+    error: str = ''
+    elapsed: float = 0.
+
+
+def run_action(printers: list[Printers], action: str, **params) -> list[ActionResult]:
+    """
+    Runs action on several printers concurrently
+
+    Every printer request (print job action, LED, preheat) is a separate task of
+    one bounded pool, so requests of all printers go out at the same time and the
+    whole action takes about one round-trip time. Job uuids are taken from the
+    telemetry cache instead of being fetched before the action.
+
+    Args:
+        printers (list[models.Printers]): printers info from database
+        action (str): one of ACTION_LABELS keys
+        **params: 'brightness', 'saturation' and 'hue' for 'led', 'temperature' for 'preheat'
+
+    Raises:
+        ValueError: if action is unknown
+
+    Returns:
+        list[ActionResult]: results in the same order as printers
+    """
+    if action not in ACTION_LABELS:
+        raise ValueError(f'Unknown action {action}')
+    started = monotonic()
+    results = [ActionResult(db_printer.id, db_printer.name) for db_printer in printers]
+    pending = []
+    for db_printer, snapshot, result in zip(printers, poller.get_many(printers, 0), results):
+        try:
+            api_printer = get_printer(db_printer)
+            if not api_printer:
+                raise ConnectionError('Принтер не подключён')
+            calls = _calls(api_printer, snapshot, action, params)
+        except Exception as exc:
+            result.ok, result.error = False, str(exc)
+            continue
+        pending += [(result, _executor.submit(_timed, call, started)) for call in calls]
+    wait([future for _, future in pending], timeout=ACTION_DEADLINE)
+    for result, future in pending:
+        if not future.done():
+            error, elapsed = 'Превышено время ожидания', ACTION_DEADLINE
+        elif future.exception() is not None:
+            error, elapsed = str(future.exception()), monotonic() - started
+        else:
+            error, elapsed = '', future.result()
+        if error and result.ok:
+            result.ok, result.error = False, error
+        result.elapsed = round(max(result.elapsed, elapsed), 3)
+    for db_printer, result in zip(printers, results):
+        if result.ok:
+            sink.write(db_printer.id, f'Действие «{ACTION_LABELS[action]}» выполнено', 'info')
+            poller.refresh(db_printer, 0)
+        else:
+            sink.write(db_printer.id, f'Действие «{ACTION_LABELS[action]}» не выполнено: {result.error}', 'error')
+    logger.debug(f'Action {action} on {len(printers)} printers took {monotonic() - started:.2f} s')
+    return results
+
+
+def _calls(api_printer, snapshot, action: str, params: dict) -> list:
+    if action in JOB_ACTIONS:
+        state, led = JOB_ACTIONS[action]
+        print_job = snapshot.print_job or {}
+        if snapshot.connected and 'state' not in print_job:
+            raise ValueError('Нет активной печати')
+        # without cached job set_print_job_state fetches the uuid itself
+        job_uuid = print_job.get('uuid')
+        return [lambda: api_printer.set_print_job_state(state, job_uuid),
+                lambda: api_printer.put_printer_led(*led)]
+    if action == 'led':
+        color = (float(params.get('brightness', 100)), float(params.get('saturation', 100)),
+                 float(params.get('hue', 0)))
+        return [lambda: api_printer.put_printer_led(*color)]
+    # preheat
+    if snapshot.connected and 'state' in (snapshot.print_job or {}):
+        raise ValueError('Принтер печатает')
+    temperature = float(params.get('temperature', 60))
+    return [lambda: api_printer.put_printer_bed_pre_heat(temperature, PREHEAT_DURATION)]
+
+
+def _timed(call, started: float) -> float:
+    call()
+    return monotonic() - started
@@ -0,0 +1,183 @@
+import json
+from dataclasses import asdict
+from hashlib import md5
+
+from django.db.models import Count, Max
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_GET, require_POST
+
+from ui_3d_app import actions as bulk_actions
+from ui_3d_app import uploads as print_uploads
+from ui_3d_app import utils
+from ui_3d_app.live import get_live_state
+from ui_3d_app.models import Logs, Printers
+from ui_3d_app.telemetry import poller
+
+LOGS_LIMIT = 100
+SNAPSHOT_WAIT = 1  # max seconds a request waits for the first poll of a printer
+
+# ETags are derived from telemetry snapshot version or the newest log row,
+# so unchanged resources are answered with 304 before the payload is built
+
+
+def _snapshot(request, printer_id: int):
+    # condition callbacks and the view share one lookup, so the body matches its ETag
+    if not hasattr(request, '_api_snapshot'):
+        db_printer = Printers.objects.filter(id=printer_id).first()
+        snapshot = poller.get(db_printer, SNAPSHOT_WAIT) if db_printer else None
+        request._api_snapshot = db_printer, snapshot
+    return request._api_snapshot
+
+
+def _printers_snapshots(request):
+    if not hasattr(request, '_api_snapshots'):
+        db_printers = list(Printers.objects.order_by('id'))
+        request._api_snapshots = list(zip(db_printers, poller.get_many(db_printers, SNAPSHOT_WAIT)))
+    return request._api_snapshots
+
+
+def _snapshot_etag(request, printer_id: int) -> str | None:
+    db_printer, snapshot = _snapshot(request, printer_id)
+    if db_printer is None:
+        return None
+    return _hash(f'{request.resolver_match.url_name}-{printer_id}-{db_printer.name}-{snapshot.version}')
+
+
+def _snapshot_modified(request, printer_id: int):
+    _, snapshot = _snapshot(request, printer_id)
+    return snapshot.changed_at if snapshot else None
+
+
+def _logs_stats(request, printer_id: int) -> dict:
+    if not hasattr(request, '_api_logs_stats'):
+        request._api_logs_stats = Logs.objects.filter(printer_id=printer_id).aggregate(
+            last_id=Max('id'), last_created=Max('created_at'), count=Count('id'))
+    return request._api_logs_stats
+
+
+def _logs_etag(request, printer_id: int) -> str:
+    stats = _logs_stats(request, printer_id)
+    return f'logs-{printer_id}-{stats["last_id"]}-{stats["count"]}'
+
+
+def _logs_modified(request, printer_id: int):
+    return _logs_stats(request, printer_id)['last_created']
+
+
+def _printers_etag(request) -> str:
+    return _hash('printers-' + '-'.join(f'{p.id}:{p.name}:{p.address}:{snapshot.version}'
+                                        for p, snapshot in _printers_snapshots(request)))
+
+
+def _hash(value: str) -> str:
+    return md5(value.encode()).hexdigest()
+
+
+@require_GET
+@condition(etag_func=_printers_etag)
+def printers(request):
+    items = []
+    for db_printer, snapshot in _printers_snapshots(request):
+        items.append({
+            'id': db_printer.id,
+            'name': db_printer.name,
+            'address': db_printer.address,
+            'connected': snapshot.connected,
+            'state': utils.snapshot_state(snapshot),
+        })
+    return JsonResponse({'printers': items}, json_dumps_params={'ensure_ascii': False})
+
+
+@require_GET
+@condition(etag_func=_snapshot_etag, last_modified_func=_snapshot_modified)
+def status(request, printer_id: int):
+    db_printer, snapshot = _snapshot(request, printer_id)
+    if db_printer is None:
+        return HttpResponse('Printer not found', status=404)
+    return JsonResponse({
+        'id': db_printer.id,
+        'name': db_printer.name,
+        'connected': snapshot.connected,
+        'changed_at': snapshot.changed_at,
+        'mode': get_live_state(snapshot)['mode'],
+        'job': utils.get_status_fields(snapshot),
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+@require_GET
+@condition(etag_func=_snapshot_etag, last_modified_func=_snapshot_modified)
+def parameters(request, printer_id: int):
+    db_printer, snapshot = _snapshot(request, printer_id)
+    if db_printer is None:
+        return HttpResponse('Printer not found', status=404)
+    return JsonResponse(utils.get_printer_parameters(db_printer, snapshot))
+
+
+@require_GET
+@condition(etag_func=_logs_etag, last_modified_func=_logs_modified)
+def logs(request, printer_id: int):
+    if not Printers.objects.filter(id=printer_id).exists():
+        return HttpResponse('Printer not found', status=404)
+    rows = Logs.objects.filter(printer_id=printer_id).order_by('-created_at') \
+        .values('id', 'created_at', 'message', 'type')[:LOGS_LIMIT]
+    return JsonResponse({'logs': list(rows)}, json_dumps_params={'ensure_ascii': False})
+
+
+# only JSON is accepted: browsers do not send it cross-site without a CORS preflight, so no CSRF token is needed
+@csrf_exempt
+@require_POST
+def actions(request):
+    """
+    Runs action on several printers at once
+
+    Body is JSON {"action": "pause", "printers": [1, 2]}; all printers are
+    selected if "printers" is omitted. Numeric parameters of actions are listed
+    in actions.ACTION_PARAMS, e.g. "temperature" of 'preheat'.
+    """
+    if request.content_type != 'application/json':
+        return HttpResponse('JSON body expected', status=415)
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return HttpResponse('Invalid JSON', status=400)
+    if not isinstance(data, dict):
+        return HttpResponse('JSON object expected', status=400)
+    action = data.pop('action', '')
+    if action not in bulk_actions.ACTION_LABELS:
+        return HttpResponse(f'Unknown action {action}', status=400)
+    printer_ids = data.pop('printers', None)
+    valid_ids = isinstance(printer_ids, list) and all(
+        isinstance(printer_id, int) and not isinstance(printer_id, bool) for printer_id in printer_ids)
+    if printer_ids is not None and not valid_ids:
+        return HttpResponse('"printers" must be a list of printer ids', status=400)
+    unknown = set(data) - set(bulk_actions.ACTION_PARAMS[action])
+    if unknown:
+        return HttpResponse(f'Unknown parameters of {action}: {", ".join(sorted(unknown))}', status=400)
+    if not all(map(_is_number, data.values())):
+        return HttpResponse('Parameters must be numbers', status=400)
+    db_printers = Printers.objects.order_by('id')
+    if printer_ids is not None:
+        db_printers = db_printers.filter(id__in=printer_ids)
+    try:
+        results = bulk_actions.run_action(list(db_printers), action, **data)
+    except (TypeError, ValueError) as exc:
+        return HttpResponse(str(exc), status=400)
+    return JsonResponse({
+        'action': action,
+        'ok': all(result.ok for result in results),
+        'results': [asdict(result) for result in results],
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+def _is_number(value) -> bool:
+    # bool is an int subclass, but true is not a temperature
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+@require_GET
+def uploads(request, upload_id: str):
+    task = print_uploads.get_upload(upload_id)
+    if task is None:
+        return HttpResponse('Upload not found', status=404)
+    return JsonResponse(task.as_dict(), json_dumps_params={'ensure_ascii': False})
@@ -1,6 +1,22 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class Ui3DAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ui_3d_app'
+
+    def ready(self):
+        # db registers SQLite tuning hook on import
+        from ui_3d_app import db  # noqa: F401
+        if settings.LOG_RETENTION_SCHEDULER and not _is_reloader_parent():
+            from ui_3d_app import retention
+            retention.start_scheduler()
+
+
+def _is_reloader_parent() -> bool:
+    # runserver with autoreload serves requests from a child process marked with RUN_MAIN
+    return 'runserver' in sys.argv and '--noreload' not in sys.argv and os.environ.get('RUN_MAIN') != 'true'
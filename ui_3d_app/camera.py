@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from io import BytesIO
+from time import monotonic
+
+from PIL import Image
+
+from cv.stream import MJPEGStream
+from ui_3d_app.models import Printers
+from ui_3d_app.utils import get_printer, log_error
+
+RELAY_FPS = 5  # max frame rate sent to browsers
+RELAY_WIDTH = 640  # width of frames sent to browsers, 0 to keep original size
+RELAY_QUALITY = 75
+RING_SIZE = 8  # number of latest frames kept in memory
+RELAY_IDLE = 60  # seconds without readers after which upstream connection is closed
+RESEND_AFTER = 10  # seconds without new frames after which the last one is sent again to detect closed clients
+FRAME_MAX_AGE = 10  # seconds after which the last frame is stale for the CV watcher, e.g. camera froze
+BOUNDARY = 'frame'
+
+logger = logging.getLogger(__name__)
+
+
+class CameraRelay():
+    """
+    Single upstream connection to printer camera shared by all viewers.
+
+    Frames are taken from upstream at most RELAY_FPS times per second, resized
+    once and kept in a ring buffer; every browser client and the CV watcher
+    read from this buffer instead of connecting to the printer.
+
+    Attributes:
+        url (str): upstream camera stream url
+        frames (deque): ring buffer of (seq, monotonic time taken, original jpeg, resized jpeg)
+    """
+
+    def __init__(self, url: str, fps: float = RELAY_FPS, width: int = RELAY_WIDTH, ring_size: int = RING_SIZE):
+        self.url = url
+        self.fps = fps
+        self.width = width
+        self.frames: deque[tuple[int, float, bytes, bytes]] = deque(maxlen=ring_size)
+        self.closed = threading.Event()
+        self._new_frame = threading.Condition()
+        self._accessed_at = monotonic()
+        self._stream = MJPEGStream(url)
+        self._thread = threading.Thread(target=self._run, name=f'camera-relay-{url}', daemon=True)
+        self._thread.start()
+
+    def latest(self, max_age: float | None = FRAME_MAX_AGE) -> bytes | None:
+        """
+        Gets the latest frame in original resolution
+
+        Args:
+            max_age (float | None): ignore frame older than this many seconds, None to get any frame
+
+        Returns:
+            bytes | None: JPEG data or None if no frame received yet or it is stale
+        """
+        self._accessed_at = monotonic()
+        if not self.frames:
+            return None
+        _, taken_at, frame, _ = self.frames[-1]
+        if max_age is not None and monotonic() - taken_at > max_age:
+            return None
+        return frame
+
+    def latest_resized(self) -> tuple[int, bytes | None]:
+        """
+        Gets the latest frame reduced for browsers
+
+        Returns:
+            tuple[int, bytes | None]: frame sequence number and JPEG data
+        """
+        self._accessed_at = monotonic()
+        if not self.frames:
+            return 0, None
+        seq, _, _, resized = self.frames[-1]
+        return seq, resized
+
+    def wait_resized(self, seq: int, timeout: float) -> tuple[int, bytes | None]:
+        """
+        Waits for a frame newer than seq, reduced for browsers
+
+        Args:
+            seq (int): sequence number of the last frame the reader got
+            timeout (float): max seconds to wait
+
+        Returns:
+            tuple[int, bytes | None]: latest frame sequence number and JPEG data, the same frame on timeout
+        """
+        with self._new_frame:
+            self._new_frame.wait_for(
+                lambda: self.closed.is_set() or (self.frames and self.frames[-1][0] != seq), timeout)
+        return self.latest_resized()
+
+    def close(self):
+        self.closed.set()
+        self._stream.close()
+        with self._new_frame:
+            self._new_frame.notify_all()
+
+    def _run(self):
+        seq = 0
+        taken_at = 0.
+        while not self.closed.is_set():
+            if monotonic() - self._accessed_at > RELAY_IDLE:
+                logger.debug(f'Camera relay {self.url} is idle, closing')
+                self.close()
+                return
+            seq, frame = self._stream.next_frame(seq, timeout=1)
+            if frame is None or monotonic() - taken_at < 1 / self.fps:
+                continue
+            taken_at = monotonic()
+            try:
+                self.frames.append((seq, taken_at, frame, self._resize(frame)))
+            except Exception as exc:
+                logger.error(f'Failed to process frame from {self.url}: {exc}')
+                continue
+            with self._new_frame:
+                self._new_frame.notify_all()
+
+    def _resize(self, frame: bytes) -> bytes:
+        if not self.width:
+            return frame
+        img = Image.open(BytesIO(frame))
+        if img.width <= self.width:
+            return frame
+        height = round(img.height * self.width / img.width)
+        img.draft('RGB', (self.width, height))
+        img = img.convert('RGB').resize((self.width, height))
+        out = BytesIO()
+        img.save(out, 'JPEG', quality=RELAY_QUALITY)
+        return out.getvalue()
+
+
+relays: dict[int, CameraRelay] = {}
+_lock = threading.Lock()
+
+
+def get_relay(db_printer: Printers) -> CameraRelay | None:
+    """
+    Gets camera relay of printer, connecting to the camera if needed
+
+    Args:
+        db_printer (models.Printers): printer info from database
+
+    Returns:
+        CameraRelay | None: relay or None if printer has no camera url
+    """
+    with _lock:
+        relay = relays.get(db_printer.id)
+        if relay and not relay.closed.is_set():
+            return relay
+    api_printer = get_printer(db_printer)
+    if not api_printer:
+        return None
+    try:
+        url = api_printer.get_camera_feed().get('url')
+    except Exception as exc:
+        logger.error(f'Failed to get camera url of printer {db_printer.address}: {exc}')
+        return None
+    if not url:
+        return None
+    with _lock:
+        relay = relays.get(db_printer.id)
+        if not relay or relay.closed.is_set():
+            relay = relays[db_printer.id] = CameraRelay(url)
+        return relay
+
+
+def stream_frames(relay: CameraRelay):
+    """
+    Multipart JPEG stream for one browser client, blocks between frames (WSGI)
+
+    Args:
+        relay (CameraRelay): relay of the printer camera
+
+    Yields:
+        bytes: multipart/x-mixed-replace parts
+    """
+    last = 0
+    sent_at = monotonic()
+    while not relay.closed.is_set():
+        seq, frame = relay.wait_resized(last, timeout=1)
+        if frame is None:
+            continue
+        # a stalled camera still gets a write now and then, so closed clients are noticed
+        if seq != last or monotonic() - sent_at > RESEND_AFTER:
+            last, sent_at = seq, monotonic()
+            yield _part(frame)
+
+
+async def astream_frames(relay: CameraRelay):
+    """
+    Multipart JPEG stream for one browser client, sleeps between frames (ASGI)
+
+    Args:
+        relay (CameraRelay): relay of the printer camera
+
+    Yields:
+        bytes: multipart/x-mixed-replace parts
+    """
+    last = 0
+    while not relay.closed.is_set():
+        seq, frame = relay.latest_resized()
+        if frame is not None and seq != last:
+            last = seq
+            yield _part(frame)
+        await asyncio.sleep(1 / relay.fps)
+
+
+def _part(frame: bytes) -> bytes:
+    return b'--' + BOUNDARY.encode() + b'\r\nContent-Type: image/jpeg\r\n' \
+        b'Content-Length: ' + str(len(frame)).encode() + b'\r\n\r\n' + frame + b'\r\n'
+
+
+def watch(service, db_printer: Printers, delay: float = 10.) -> bool:
+    """
+    Starts error detection on printer camera frames taken from its relay
+
+    Args:
+        service (cv.ClassifyService): classification service
+        db_printer (models.Printers): printer info from database
+        delay (float): delay between classifications
+
+    Returns:
+        bool: False if printer has no camera
+    """
+    relay = get_relay(db_printer)
+    if relay is None:
+        return False
+
+    def source() -> bytes | None:
+        # relay is looked up every time, as idle relay may be closed and reopened;
+        # stale frame of a frozen camera is not classified again
+        relay = get_relay(db_printer)
+        return relay.latest() if relay else None
+
+    service.start_watching(relay.url, log_error, str(db_printer.id), delay, source=source)
+    return True
@@ -0,0 +1,140 @@
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import monotonic
+
+from printer import Ultimaker as UL
+
+CLIENTS_MAXSIZE = 64
+CLIENT_TTL = 10 * 60  # seconds before client is rebuilt and its auth checked again
+RETRY_BACKOFF = 5  # seconds before the first reconnect to an offline printer
+RETRY_BACKOFF_MAX = 5 * 60
+
+
+@dataclass
+class _Entry():
+    key: tuple
+    client: UL | None
+    expires_at: float
+    failures: int = 0
+
+
+class ClientRegistry():
+    """
+    LRU/TTL cache of Ultimaker clients keyed by printer id and credentials.
+
+    Clients are cheap to create (authentication is lazy), so offline printers are
+    reported by callers with report_failure: the printer is not contacted again
+    until its backoff (doubled after each consecutive failure) is over. Callers
+    report answered requests with report_success, which ends the failure streak.
+
+    Attributes:
+        hits (int): requests served by a cached client
+        misses (int): requests that created a new client
+        negative_hits (int): requests refused because printer is in backoff
+    """
+
+    def __init__(self, maxsize: int = CLIENTS_MAXSIZE, ttl: float = CLIENT_TTL,
+                 backoff: float = RETRY_BACKOFF, max_backoff: float = RETRY_BACKOFF_MAX):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.logger = logging.getLogger(__name__)
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db_printer) -> UL | None:
+        """
+        Gets client for printer, creating it if needed
+
+        Args:
+            db_printer (models.Printers): printer info from database
+
+        Returns:
+            printer.Ultimaker | None: client or None if printer is in backoff after failure
+        """
+        key = (db_printer.address, db_printer.api_id, db_printer.api_key)
+        with self._lock:
+            entry = self._entries.get(db_printer.id)
+            if entry and entry.key == key and monotonic() < entry.expires_at:
+                self._entries.move_to_end(db_printer.id)
+                if entry.client is None:
+                    self.negative_hits += 1
+                else:
+                    self.hits += 1
+                return entry.client
+            self.misses += 1
+            # retry after backoff keeps the streak until report_success, so backoff still grows
+            # while the printer stays offline; other new clients start without failures
+            failures = entry.failures if entry and entry.key == key and entry.client is None else 0
+        # credentials in database are authoritative: client must not replace them when registration times out
+        client = UL(ip=db_printer.address, credentials=db_printer.get_credentials(), auto_register=False)
+        self._put(db_printer.id, _Entry(key, client, monotonic() + self.ttl, failures))
+        return client
+
+    def report_failure(self, db_printer):
+        """
+        Marks printer as offline after a failed request, so it is not contacted until backoff is over
+
+        Args:
+            db_printer (models.Printers): printer info from database
+        """
+        key = (db_printer.address, db_printer.api_id, db_printer.api_key)
+        with self._lock:
+            entry = self._entries.get(db_printer.id)
+            failures = entry.failures if entry and entry.key == key else 0
+        self.logger.debug(f'Printer {db_printer.address} is offline')
+        self._put(db_printer.id, self._failed_entry(key, failures))
+
+    def report_success(self, db_printer):
+        """
+        Resets failure streak of printer after it answered, so the next failure gets the shortest backoff
+
+        Args:
+            db_printer (models.Printers): printer info from database
+        """
+        key = (db_printer.address, db_printer.api_id, db_printer.api_key)
+        with self._lock:
+            entry = self._entries.get(db_printer.id)
+            if entry and entry.key == key and entry.client is not None:
+                entry.failures = 0
+
+    def _failed_entry(self, key: tuple, failures: int) -> _Entry:
+        backoff = min(self.backoff * 2 ** failures, self.max_backoff)
+        self.logger.debug(f'Printer {key[0]} will be retried in {backoff} s')
+        return _Entry(key, None, monotonic() + backoff, failures + 1)
+
+    def invalidate(self, printer_id: int):
+        """
+        Drops cached client, e.g. after printer credentials changed or printer was deleted
+
+        Args:
+            printer_id (int): printer id in database
+        """
+        with self._lock:
+            self._entries.pop(printer_id, None)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: cache counters and current size
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'negative_hits': self.negative_hits, 'size': len(self._entries)}
+
+    def _put(self, printer_id: int, entry: _Entry):
+        # replaced and evicted clients are not closed: other threads may still be in a request with them,
+        # their connections are released when the last reference is gone
+        with self._lock:
+            self._entries.pop(printer_id, None)
+            self._entries[printer_id] = entry
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+registry = ClientRegistry()
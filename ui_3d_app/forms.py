@@ -1,6 +1,9 @@
 from django import forms
 
+from ui_3d_app.models import Printers
+
 
 class PostPrintJobForm(forms.Form):
-    job_name = forms.CharField(max_length=100, placeholder="Job name")
+    job_name = forms.CharField(max_length=100, widget=forms.TextInput(attrs={'placeholder': 'Job name'}))
     file = forms.FileField()
+    printers = forms.ModelMultipleChoiceField(queryset=Printers.objects.order_by('id'))
@@ -0,0 +1,243 @@
+import asyncio
+import json
+import logging
+import queue
+import threading
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils.formats import date_format
+from django.utils.timezone import localtime
+
+from ui_3d_app import utils
+from ui_3d_app.models import Logs, Printers
+from ui_3d_app.telemetry import poller
+
+LIVE_INTERVAL = 1  # seconds between two checks of the telemetry cache
+KEEPALIVE = 15  # seconds of silence after which a comment is sent to keep connection open
+QUEUE_SIZE = 16  # diffs buffered for slow client before it gets full state instead
+
+logger = logging.getLogger(__name__)
+
+
+def get_live_state(snapshot) -> dict:
+    """
+    Gets dashboard fields of one printer from cached telemetry
+
+    Args:
+        snapshot (telemetry.Snapshot): cached printer documents
+
+    Returns:
+        dict: flat dict of displayed values
+    """
+    if not snapshot.connected:
+        mode = 'offline'
+    else:
+        mode = snapshot.print_job.get('state', 'idle')
+    state = {
+        'mode': mode,
+        'updated_at': localtime(snapshot.updated_at).strftime('%H:%M:%S') if snapshot.updated_at else '',
+    }
+    state.update(utils.get_status_fields(snapshot))
+    return state
+
+
+class LiveHub():
+    """
+    Broadcasts changes of one printer to every connected dashboard.
+
+    While there are subscribers one thread compares the telemetry snapshot with
+    the previous one and publishes only changed fields and new Logs rows, so
+    the cost does not depend on the number of open dashboards. Under WSGI
+    streams are plain generators blocking on their queue, a disconnected
+    client is noticed when a keep-alive comment fails to send.
+    The hub stops and is removed from hubs with its last subscriber.
+    """
+
+    def __init__(self, db_printer: Printers):
+        self.db_printer = db_printer
+        self.state: dict = {}
+        self.subscribers: set[queue.Queue] = set()
+        self._last_log_id: int | None = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def stream(self):
+        """
+        Server-Sent Events stream for one client: full state first, then diffs; blocks between events (WSGI)
+
+        Yields:
+            str: SSE messages
+        """
+        subscription = self._subscribe()
+        if subscription is None:
+            yield from get_hub(self.db_printer).stream()
+            return
+        events, state = subscription
+        try:
+            yield self._event(state)
+            while True:
+                try:
+                    diff = events.get(timeout=KEEPALIVE)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if diff is None:
+                    return
+                yield self._event(diff)
+        finally:
+            self._unsubscribe(events)
+
+    async def astream(self):
+        """
+        Same as stream, but sleeps between checks of the queue instead of blocking (ASGI)
+
+        Yields:
+            str: SSE messages
+        """
+        subscription = await sync_to_async(self._subscribe)()
+        if subscription is None:
+            async for message in get_hub(self.db_printer).astream():
+                yield message
+            return
+        events, state = subscription
+        try:
+            yield self._event(state)
+            idle = 0
+            while True:
+                try:
+                    diff = events.get_nowait()
+                except queue.Empty:
+                    await asyncio.sleep(LIVE_INTERVAL)
+                    idle += LIVE_INTERVAL
+                    if idle >= KEEPALIVE:
+                        idle = 0
+                        yield ': keepalive\n\n'
+                    continue
+                if diff is None:
+                    return
+                idle = 0
+                yield self._event(diff)
+        finally:
+            self._unsubscribe(events)
+
+    def close(self):
+        """
+        Stops the hub and ends streams of all subscribers
+        """
+        with self._lock:
+            self._stopped.set()
+            for events in self.subscribers:
+                while not events.empty():
+                    events.get_nowait()
+                events.put_nowait(None)
+            self.subscribers.clear()
+
+    def _subscribe(self) -> tuple[queue.Queue, dict] | None:
+        # None if the hub stopped after the view got it
+        events = queue.Queue(maxsize=QUEUE_SIZE)
+        with self._lock:
+            if self._stopped.is_set():
+                return None
+            self.subscribers.add(events)
+            if self._thread is None:
+                self.state = self._update()[0]
+                self._thread = threading.Thread(target=self._run, name=f'live-{self.db_printer.id}', daemon=True)
+                self._thread.start()
+            return events, self.state
+
+    def _unsubscribe(self, events: queue.Queue):
+        with _hubs_lock, self._lock:
+            self.subscribers.discard(events)
+            if self.subscribers or self._stopped.is_set():
+                return
+            self._stopped.set()
+            if hubs.get(self.db_printer.id) is self:
+                del hubs[self.db_printer.id]
+        logger.debug(f'Live updates of printer {self.db_printer.id} stopped')
+
+    def _run(self):
+        while not self._stopped.wait(LIVE_INTERVAL):
+            try:
+                state, diff = self._update()
+            except Exception as exc:
+                logger.error(f'Live update for printer {self.db_printer.id} failed: {exc}')
+                continue
+            finally:
+                close_old_connections()
+            with self._lock:
+                self.state = state
+                if diff:
+                    self._publish(diff)
+
+    def _update(self) -> tuple[dict, dict]:
+        # telemetry cache only: the poller thread waits for the printer, not the hub
+        snapshot = poller.get(self.db_printer, wait_for=0)
+        state = get_live_state(snapshot)
+        diff = {key: value for key, value in state.items() if self.state.get(key) != value}
+        diff.update({key: None for key in self.state.keys() - state.keys()})
+        logs = self._new_logs()
+        if logs:
+            diff['logs'] = logs
+        return state, diff
+
+    def _new_logs(self) -> list[dict]:
+        queryset = Logs.objects.filter(printer_id=self.db_printer.id)
+        if self._last_log_id is None:
+            last = queryset.order_by('-id').values_list('id', flat=True).first()
+            self._last_log_id = last or 0
+            return []
+        logs = list(queryset.filter(id__gt=self._last_log_id).order_by('id')
+                    .values('id', 'created_at', 'message', 'type'))
+        if logs:
+            self._last_log_id = logs[-1]['id']
+        return [{'created_at': date_format(localtime(log['created_at']), 'DATETIME_FORMAT'), 'message': log['message'], 'type': log['type']}
+                for log in logs]
+
+    def _publish(self, diff: dict):
+        for events in self.subscribers:
+            if events.full():
+                # client is too slow: replace missed diffs with the whole state
+                while not events.empty():
+                    events.get_nowait()
+                events.put_nowait({**self.state, **diff})
+            else:
+                events.put_nowait(diff)
+
+    @staticmethod
+    def _event(data: dict) -> str:
+        return f'data: {json.dumps(data, ensure_ascii=False, separators=(",", ":"))}\n\n'
+
+
+hubs: dict[int, LiveHub] = {}
+_hubs_lock = threading.Lock()
+
+
+def get_hub(db_printer: Printers) -> LiveHub:
+    """
+    Gets shared hub of printer, creating it on first subscription
+
+    Args:
+        db_printer (models.Printers): printer info from database
+
+    Returns:
+        LiveHub: hub of the printer
+    """
+    with _hubs_lock:
+        if db_printer.id not in hubs:
+            hubs[db_printer.id] = LiveHub(db_printer)
+        return hubs[db_printer.id]
+
+
+@receiver(post_delete, sender=Printers)
+def close_hub(sender, instance: Printers, **kwargs):
+    """
+    Ends live streams of deleted printer
+    """
+    with _hubs_lock:
+        hub = hubs.pop(instance.id, None)
+    if hub:
+        hub.close()
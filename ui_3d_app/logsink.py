@@ -0,0 +1,100 @@
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from time import sleep
+
+from django.db import close_old_connections, transaction
+
+from ui_3d_app.models import Logs, Printers
+
+FLUSH_INTERVAL = 1  # seconds between two writes to database
+QUEUE_LIMIT = 10000  # max number of distinct messages waiting for flush
+
+
+class LogSink():
+    """
+    Buffered writer of Logs rows.
+
+    Messages are queued by callers without touching the database and written
+    by a background thread with one bulk insert per FLUSH_INTERVAL. Identical
+    messages of the same printer within one interval are merged into one row
+    with a counter; when the queue is full new distinct messages are dropped.
+
+    Attributes:
+        dropped (int): number of messages dropped because queue was full
+    """
+
+    def __init__(self, interval: float = FLUSH_INTERVAL, limit: int = QUEUE_LIMIT):
+        self.interval = interval
+        self.limit = limit
+        self.dropped = 0
+        self.logger = logging.getLogger(__name__)
+        self._buffer: OrderedDict[tuple[int, str, str], int] = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def write(self, printer_id: int, message: str, type: str = 'info'):
+        """
+        Queues log message
+
+        Args:
+            printer_id (int): printer id in database
+            message (str): log message
+            type (str): log type, e.g. 'info' or 'error'
+        """
+        key = (int(printer_id), type, message)
+        with self._lock:
+            if key in self._buffer:
+                self._buffer[key] += 1
+            elif len(self._buffer) < self.limit:
+                self._buffer[key] = 1
+            else:
+                self.dropped += 1
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='log-sink', daemon=True)
+                self._thread.start()
+
+    def flush(self):
+        """
+        Writes all queued messages in one transaction
+        """
+        with self._flush_lock:
+            with self._lock:
+                buffer, self._buffer = self._buffer, OrderedDict()
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                self.logger.warning(f'{dropped} log messages dropped, queue is full')
+            if not buffer:
+                return
+            try:
+                existing = set(Printers.objects.filter(id__in={key[0] for key in buffer})
+                               .values_list('id', flat=True))
+                rows = [Logs(printer_id_id=printer_id, type=type,
+                             message=message if count == 1 else f'{message} (×{count})')
+                        for (printer_id, type, message), count in buffer.items()
+                        if printer_id in existing]
+                with transaction.atomic():
+                    Logs.objects.bulk_create(rows)
+                self.logger.debug(f'{len(rows)} log rows written')
+            except Exception as exc:
+                self.logger.error(f'Failed to write {len(buffer)} log rows: {exc}')
+            finally:
+                close_old_connections()
+
+    def close(self):
+        """
+        Writes messages left in queue, called on interpreter shutdown
+        """
+        self.flush()
+
+    def _run(self):
+        while True:
+            sleep(self.interval)
+            self.flush()
+
+
+sink = LogSink()
+atexit.register(sink.close)
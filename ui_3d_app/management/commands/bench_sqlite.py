@@ -0,0 +1,85 @@
+import sqlite3
+import tempfile
+import threading
+from pathlib import Path
+from time import monotonic
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+DEFAULT_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+
+class Command(BaseCommand):
+    help = 'Compares SQLite read/write throughput of default settings and SQLITE_PRAGMAS ' \
+        'on a Logs-like workload with concurrent readers and writers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5, help='duration of each run')
+        parser.add_argument('--readers', type=int, default=4, help='number of reading threads')
+        parser.add_argument('--writers', type=int, default=2, help='number of writing threads')
+
+    def handle(self, *args, **options):
+        runs = [
+            ('default', DEFAULT_PRAGMAS, 5),
+            ('tuned', settings.SQLITE_PRAGMAS, settings.DATABASES['default']['OPTIONS']['timeout']),
+        ]
+        for name, pragmas, timeout in runs:
+            with tempfile.TemporaryDirectory() as tmp:
+                reads, writes, errors = self._run(Path(tmp) / 'bench.sqlite3', pragmas, timeout, options)
+            seconds = options['seconds']
+            self.stdout.write(f'{name:>8}: {reads / seconds:9.0f} reads/s, '
+                              f'{writes / seconds:7.0f} writes/s, {errors} lock errors')
+
+    def _run(self, path: Path, pragmas: dict, timeout: float, options: dict) -> tuple[int, int, int]:
+        with self._connect(path, pragmas, timeout) as db:
+            db.execute('CREATE TABLE logs (id INTEGER PRIMARY KEY, printer_id INTEGER, '
+                       'message TEXT, type TEXT, created_at REAL)')
+            db.execute('CREATE INDEX logs_printer_created_idx ON logs (printer_id, created_at DESC)')
+            db.executemany('INSERT INTO logs (printer_id, message, type, created_at) VALUES (?, ?, ?, ?)',
+                           [(i % 10, 'message', 'info', i) for i in range(10000)])
+        counters = {'reads': 0, 'writes': 0, 'errors': 0}
+        lock = threading.Lock()
+        deadline = monotonic() + options['seconds']
+
+        def reader(n: int):
+            db = self._connect(path, pragmas, timeout)
+            while monotonic() < deadline:
+                try:
+                    db.execute('SELECT * FROM logs WHERE printer_id = ? ORDER BY created_at DESC LIMIT 100',
+                               (n % 10,)).fetchall()
+                    key = 'reads'
+                except sqlite3.OperationalError:
+                    key = 'errors'
+                with lock:
+                    counters[key] += 1
+            db.close()
+
+        def writer(n: int):
+            db = self._connect(path, pragmas, timeout)
+            while monotonic() < deadline:
+                try:
+                    with db:
+                        db.execute('INSERT INTO logs (printer_id, message, type, created_at) VALUES (?, ?, ?, ?)',
+                                   (n % 10, 'message', 'error', monotonic()))
+                    key = 'writes'
+                except sqlite3.OperationalError:
+                    key = 'errors'
+                with lock:
+                    counters[key] += 1
+            db.close()
+
+        threads = [threading.Thread(target=reader, args=(i,)) for i in range(options['readers'])]
+        threads += [threading.Thread(target=writer, args=(i,)) for i in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return counters['reads'], counters['writes'], counters['errors']
+
+    @staticmethod
+    def _connect(path: Path, pragmas: dict, timeout: float) -> sqlite3.Connection:
+        db = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        for name, value in pragmas.items():
+            db.execute(f'PRAGMA {name} = {value}')
+        return db
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from ui_3d_app.retention import RETENTION_BATCH, RETENTION_DAYS, prune_logs
+
+
+class Command(BaseCommand):
+    help = 'Deletes old printer logs in batches and keeps their daily counts in LogsRollup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=RETENTION_DAYS,
+                            help='keep logs of this many last days')
+        parser.add_argument('--batch-size', type=int, default=RETENTION_BATCH,
+                            help='max rows deleted in one transaction')
+
+    def handle(self, *args, **options):
+        deleted = prune_logs(options['days'], options['batch_size'])
+        self.stdout.write(f'{deleted} log rows deleted')
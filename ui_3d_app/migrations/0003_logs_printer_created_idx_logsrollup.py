@@ -0,0 +1,36 @@
+# Generated by Django 4.2 on 2026-10-18 00:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ui_3d_app', '0002_remove_logs_error_logs_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogsRollup',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('type', models.CharField(max_length=16)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='logs',
+            index=models.Index(fields=['printer_id', '-created_at'], name='logs_printer_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='logsrollup',
+            name='printer_id',
+            field=models.ForeignKey(db_column='printer_id', on_delete=django.db.models.deletion.CASCADE, to='ui_3d_app.printers'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='logsrollup',
+            unique_together={('printer_id', 'day', 'type')},
+        ),
+    ]
@@ -2,6 +2,8 @@ import logging
 
 from django.db import models
 
+from ui_3d_app.clients import registry
+
 
 class Users(models.Model):
     id = models.AutoField(primary_key=True)
@@ -50,8 +52,13 @@ class Printers(models.Model):
         self.api_id = api_id
         self.api_key = api_key
         self.save()
+        registry.invalidate(self.id)
         self.logger.debug(f'Printer {self.address} credentials updated')
 
+    def delete(self, *args, **kwargs):
+        registry.invalidate(self.id)
+        return super().delete(*args, **kwargs)
+
 
 class Logs(models.Model):
     id = models.AutoField(primary_key=True)
@@ -64,13 +71,33 @@ class Logs(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     logger = logging.getLogger(__name__)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['printer_id', '-created_at'], name='logs_printer_created_idx'),
+        ]
+
     def __str__(self):
         return f'Id: {self.id}, Printer id: {self.printer_id}, Message: {self.message}'
 
     def save(self, *args, **kwargs):
         self.logger.debug(
-            f'Log {self.id} for printer {self.printer_id.address} saved')
+            f'Log {self.id} for printer {self.printer_id_id} saved')
         super().save(*args, **kwargs)
 
     def to_str(self):
         return f'Printer: {self.printer_id} | {self.message}'
+
+
+class LogsRollup(models.Model):
+    id = models.AutoField(primary_key=True)
+    printer_id = models.ForeignKey(
+        Printers, on_delete=models.CASCADE, db_column='printer_id')
+    day = models.DateField()
+    type = models.CharField(max_length=16)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [('printer_id', 'day', 'type')]
+
+    def __str__(self):
+        return f'Printer id: {self.printer_id_id}, Day: {self.day}, Type: {self.type}, Count: {self.count}'
@@ -0,0 +1,100 @@
+import logging
+import threading
+from datetime import timedelta
+from time import sleep
+
+from django.db import OperationalError, close_old_connections, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from ui_3d_app.models import Logs, LogsRollup
+
+RETENTION_DAYS = 30  # logs older than this are rolled up and deleted
+RETENTION_BATCH = 1000  # rows deleted in one transaction
+RETENTION_PAUSE = 0.1  # seconds between batches, lets other writers take the lock
+RETENTION_RETRIES = 5  # attempts of a batch that failed because the database was busy
+RETENTION_INTERVAL = 60 * 60  # seconds between two scheduled runs
+
+logger = logging.getLogger(__name__)
+
+
+def prune_logs(days: int = RETENTION_DAYS, batch_size: int = RETENTION_BATCH, pause: float = RETENTION_PAUSE) -> int:
+    """
+    Deletes old logs in small batches, adding their counts to LogsRollup
+
+    Args:
+        days (int): keep logs of this many last days
+        batch_size (int): max rows deleted in one transaction
+        pause (float): seconds to sleep between batches
+
+    Returns:
+        int: number of deleted rows
+
+    Raises:
+        OperationalError: if a batch failed RETENTION_RETRIES times
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted = 0
+    while True:
+        for attempt in range(RETENTION_RETRIES):
+            try:
+                selected, batch_deleted = _prune_batch(cutoff, batch_size)
+                break
+            except OperationalError as exc:
+                # under WAL, a transaction that reads before writing fails with SQLITE_BUSY_SNAPSHOT
+                # instead of waiting when another connection wrote meanwhile; the batch is rolled back
+                if attempt == RETENTION_RETRIES - 1:
+                    raise
+                logger.warning(f'Logs retention batch failed, retrying: {exc}')
+                sleep(pause)
+        deleted += batch_deleted
+        logger.debug(f'{deleted} old log rows deleted')
+        if selected < batch_size:
+            break
+        sleep(pause)
+    return deleted
+
+
+def _prune_batch(cutoff, batch_size: int) -> tuple[int, int]:
+    with transaction.atomic():
+        ids = list(Logs.objects.filter(created_at__lt=cutoff)
+                   .order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return 0, 0
+        counts = Logs.objects.filter(id__in=ids) \
+            .annotate(day=TruncDate('created_at')) \
+            .values('printer_id', 'day', 'type').annotate(count=Count('id'))
+        for row in counts:
+            rollup, created = LogsRollup.objects.get_or_create(
+                printer_id_id=row['printer_id'], day=row['day'], type=row['type'],
+                defaults={'count': row['count']})
+            if not created:
+                LogsRollup.objects.filter(id=rollup.id).update(count=F('count') + row['count'])
+        return len(ids), Logs.objects.filter(id__in=ids).delete()[0]
+
+
+def _run(interval: float):
+    while True:
+        sleep(interval)
+        try:
+            prune_logs()
+        except Exception as exc:
+            logger.error(f'Logs retention failed: {exc}')
+        finally:
+            close_old_connections()
+
+
+def start_scheduler(interval: float = RETENTION_INTERVAL) -> threading.Thread:
+    """
+    Starts background thread that prunes old logs every interval seconds
+
+    Args:
+        interval (float): seconds between runs
+
+    Returns:
+        threading.Thread: scheduler thread
+    """
+    thread = threading.Thread(target=_run, args=(interval,), name='logs-retention', daemon=True)
+    thread.start()
+    return thread
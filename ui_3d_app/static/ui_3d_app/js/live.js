@@ -0,0 +1,29 @@
+liveScript = document.currentScript
+liveMode = null
+liveSource = new EventSource(liveScript.dataset.url)
+liveSource.addEventListener('message', (event) => {
+    data = JSON.parse(event.data)
+    // status layout and buttons depend on printer state, so it is rendered by the server
+    if ('mode' in data) {
+        if (liveMode !== null && data.mode !== liveMode) {
+            liveSource.close()
+            window.location.reload()
+            return
+        }
+        liveMode = data.mode
+    }
+    for (const [key, value] of Object.entries(data)) {
+        document.querySelectorAll(`[data-live="${key}"]`).forEach((element) => {
+            element.textContent = value
+        })
+    }
+    logs = document.querySelector('.log_content')
+    for (const log of data.logs || []) {
+        row = document.createElement('p')
+        if (log.type === 'error') {
+            row.className = 'log_warning'
+        }
+        row.textContent = `${log.created_at} | ${log.message}`
+        logs.prepend(row)
+    }
+})
@@ -0,0 +1,25 @@
+uploadBlock = document.getElementById('upload')
+uploadStates = {pending: 'в очереди', uploading: 'отправка', done: 'отправлен', error: 'ошибка'}
+uploadTimer = setInterval(async () => {
+    response = await fetch(uploadBlock.dataset.url)
+    if (!response.ok) {
+        clearInterval(uploadTimer)
+        return
+    }
+    data = await response.json()
+    for (const printer of data.printers) {
+        element = uploadBlock.querySelector(`[data-upload="${printer.printer_id}"]`)
+        percent = printer.total ? Math.floor(printer.sent * 100 / printer.total) : 0
+        text = `${printer.name}: ${uploadStates[printer.state]}`
+        if (printer.state === 'uploading') {
+            text += ` ${percent}%`
+        } else if (printer.state === 'error') {
+            text += ` — ${printer.error}`
+            element.className = 'log_warning'
+        }
+        element.textContent = text
+    }
+    if (data.done) {
+        clearInterval(uploadTimer)
+    }
+}, 1000)
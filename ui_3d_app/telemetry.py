@@ -0,0 +1,191 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from time import sleep
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+from ui_3d_app.clients import registry
+from ui_3d_app.models import Printers
+
+POLL_INTERVAL = 5  # seconds between two polls of the same printer
+POLL_WORKERS = 16
+
+
+@dataclass
+class Snapshot():
+    """
+    Last known documents of one printer
+
+    Attributes:
+        printer (dict | None): response of /printer
+        print_job (dict | None): response of /print_job
+        system (dict | None): response of /system
+        connected (bool): whether the last poll reached the printer
+        updated_at (datetime | None): time of the last successful poll
+        error (str): error of the last poll, empty if it succeeded
+        version (int): incremented every time documents or connection state change
+        changed_at (datetime | None): time of the last change
+    """
+    printer: dict | None = None
+    print_job: dict | None = None
+    system: dict | None = None
+    connected: bool = False
+    updated_at: datetime | None = None
+    error: str = ''
+    version: int = 0
+    changed_at: datetime | None = None
+
+    @property
+    def age(self) -> float | None:
+        """Seconds since the last successful poll"""
+        if self.updated_at is None:
+            return None
+        return (timezone.now() - self.updated_at).total_seconds()
+
+
+@dataclass
+class _Entry():
+    snapshot: Snapshot = field(default_factory=Snapshot)
+    future: Future | None = None
+    polled: bool = False
+
+
+class TelemetryPoller():
+    """
+    Background poller that keeps a shared in-memory cache of printer states.
+
+    Every POLL_INTERVAL seconds all printers from the database are polled
+    concurrently; views read the cached snapshots and never wait for a printer
+    that already has data.
+    """
+
+    def __init__(self, interval: float = POLL_INTERVAL, workers: int = POLL_WORKERS):
+        self.interval = interval
+        self.logger = logging.getLogger(__name__)
+        self._entries: dict[int, _Entry] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='telemetry')
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        """
+        Starts polling thread if it is not running yet
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='telemetry-poller', daemon=True)
+            self._thread.start()
+
+    def get(self, db_printer: Printers, wait_for: float = POLL_INTERVAL) -> Snapshot:
+        """
+        Gets cached printer snapshot, polling the printer if it was never polled
+
+        Args:
+            db_printer (models.Printers): printer info from database
+            wait_for (float): max seconds to wait for the first poll
+
+        Returns:
+            Snapshot: last known printer state
+        """
+        return self.get_many([db_printer], wait_for)[0]
+
+    def get_many(self, db_printers: list[Printers], wait_for: float = POLL_INTERVAL) -> list[Snapshot]:
+        """
+        Gets cached snapshots of several printers, first polls run concurrently
+
+        Args:
+            db_printers (list[models.Printers]): printers info from database
+            wait_for (float): max seconds to wait for all first polls together
+
+        Returns:
+            list[Snapshot]: last known printer states in the same order
+        """
+        self.start()
+        entries = [self._entry(db_printer) for db_printer in db_printers]
+        pending = [self._submit(db_printer) for db_printer, entry in zip(db_printers, entries)
+                   if not entry.polled]
+        if pending and wait_for > 0:
+            wait(pending, timeout=wait_for)
+        return [entry.snapshot for entry in entries]
+
+    def refresh(self, db_printer: Printers, wait_for: float = POLL_INTERVAL) -> Snapshot:
+        """
+        Polls printer right now, e.g. after an action changed its state
+
+        Args:
+            db_printer (models.Printers): printer info from database
+            wait_for (float): max seconds to wait for the poll
+
+        Returns:
+            Snapshot: fresh printer state or the previous one on timeout
+        """
+        wait([self._submit(db_printer)], timeout=wait_for)
+        return self._entry(db_printer).snapshot
+
+    def _entry(self, db_printer: Printers) -> _Entry:
+        with self._lock:
+            return self._entries.setdefault(db_printer.id, _Entry())
+
+    def _submit(self, db_printer: Printers) -> Future:
+        entry = self._entry(db_printer)
+        with self._lock:
+            # do not stack polls of a printer that answers slower than the interval
+            if entry.future is None or entry.future.done():
+                entry.future = self._executor.submit(self._poll, db_printer, entry)
+            return entry.future
+
+    def _poll(self, db_printer: Printers, entry: _Entry):
+        from ui_3d_app.utils import get_printer
+        previous = entry.snapshot
+        try:
+            api_printer = get_printer(db_printer)
+            if not api_printer:
+                # printer is in backoff: last known state stays visible, marked as offline
+                snapshot = Snapshot(previous.printer, previous.print_job, previous.system,
+                                    False, previous.updated_at, 'Принтер не подключён')
+            else:
+                snapshot = Snapshot(
+                    printer=api_printer.get_printer(),
+                    print_job=api_printer.get_print_job(),
+                    system=api_printer.get_system(),
+                    connected=True,
+                    updated_at=timezone.now(),
+                )
+                registry.report_success(db_printer)
+        except Exception as exc:
+            self.logger.error(f'Failed to poll printer {db_printer.address}: {exc}')
+            registry.report_failure(db_printer)
+            snapshot = Snapshot(previous.printer, previous.print_job, previous.system,
+                                False, previous.updated_at, str(exc))
+        finally:
+            close_old_connections()
+        if (snapshot.printer, snapshot.print_job, snapshot.system, snapshot.connected) == \
+                (previous.printer, previous.print_job, previous.system, previous.connected):
+            snapshot.version, snapshot.changed_at = previous.version, previous.changed_at
+        else:
+            snapshot.version, snapshot.changed_at = previous.version + 1, timezone.now()
+        entry.snapshot = snapshot
+        entry.polled = True
+
+    def _run(self):
+        while True:
+            try:
+                printers = list(Printers.objects.all())
+                close_old_connections()
+                known = {db_printer.id for db_printer in printers}
+                with self._lock:
+                    for printer_id in set(self._entries) - known:
+                        del self._entries[printer_id]
+                for db_printer in printers:
+                    self._submit(db_printer)
+            except Exception as exc:
+                self.logger.error(f'Telemetry poll failed: {exc}')
+            sleep(self.interval)
+
+
+poller = TelemetryPoller()
@@ -1,3 +1,465 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from PIL import Image
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from cv.batcher import InferenceBatcher
+from cv.change import TileCache
+from cv.decode import FrameDecoder, normalize
+from cv.model import TILE_SIZE
+from cv.scheduler import WatchScheduler
+from cv.stream import MultipartParser, get_boundary
+from ui_3d_app import retention
+from ui_3d_app.clients import ClientRegistry
+from ui_3d_app.logsink import LogSink
+from ui_3d_app.models import Logs, LogsRollup, Printers
+from ui_3d_app.telemetry import Snapshot, poller
+
+# max number of database queries per page, a view that goes over it fails the tests
+QUERY_BUDGET = {
+    'index': 2,
+    'control': 1,
+    'camera': 1,
+    'fleet': 1,
+}
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Number of queries of printer pages must not depend on the number of printers and logs
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.printers = [Printers.objects.create(name=f'Printer {i}', address=f'10.0.0.{i}',
+                                                api_id=str(i), api_key=str(i))
+                        for i in range(5)]
+        Logs.objects.bulk_create([Logs(printer_id=printer, message=f'Message {i}')
+                                  for printer in cls.printers for i in range(20)])
+
+    def setUp(self):
+        # printers are not contacted, telemetry cache answers with offline snapshots
+        patcher = mock.patch.object(poller, 'get_many',
+                                    side_effect=lambda printers, *args: [Snapshot() for _ in printers])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertMaxQueries(self, budget: int, url: str):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        queries = '\n'.join(query['sql'] for query in context.captured_queries)
+        self.assertLessEqual(len(context), budget,
+                             f'{url} made {len(context)} queries, budget is {budget}:\n{queries}')
+
+    def test_index(self):
+        self.assertMaxQueries(QUERY_BUDGET['index'], '/index')
+        self.assertMaxQueries(QUERY_BUDGET['index'], f'/index/{self.printers[-1].id}')
+
+    def test_control(self):
+        self.assertMaxQueries(QUERY_BUDGET['control'], f'/control/{self.printers[-1].id}')
+
+    @mock.patch('ui_3d_app.camera.get_relay', return_value=None)
+    def test_camera(self, get_relay):
+        self.assertMaxQueries(QUERY_BUDGET['camera'], f'/camera/{self.printers[-1].id}')
+
+    def test_fleet(self):
+        self.assertMaxQueries(QUERY_BUDGET['fleet'], '/fleet?state=printing&sort=-progress')
+
+    def test_missing_printer(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/control/1000')
+        self.assertEqual(response.status_code, 404)
+
+
+class ApiTests(TestCase):
+    """
+    ETags of the JSON API describe the same telemetry the body is built from
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.printer = Printers.objects.create(name='Printer', address='10.0.0.1', api_id='1', api_key='1')
+
+    def setUp(self):
+        patcher = mock.patch.object(poller, 'get_many',
+                                    side_effect=lambda printers, *args: [Snapshot(version=1) for _ in printers])
+        self.get_many = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_snapshot_loaded_once(self):
+        for url in (f'/api/printers/{self.printer.id}/status', f'/api/printers/{self.printer.id}/parameters',
+                    '/api/printers'):
+            self.get_many.reset_mock()
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.get_many.call_count, 1, url)
+            self.assertLessEqual(self.get_many.call_args.args[1], 1, url)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+    def test_logs_stats_loaded_once(self):
+        url = f'/api/printers/{self.printer.id}/logs'
+        Logs.objects.create(printer_id=self.printer, message='Message')
+        # stats for ETag and Last-Modified, printer check, rows
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_actions_body_must_be_object(self):
+        response = self.client.post('/api/actions', '[1]', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    @mock.patch('ui_3d_app.actions.run_action', return_value=[])
+    def test_actions_validated(self, run_action):
+        for body in ({'action': 'pause', 'printers': '1'}, {'action': 'pause', 'printers': [1, '2']},
+                     {'action': 'pause', 'printers': [True]}, {'action': 'led', 'temperature': 60},
+                     {'action': 'preheat', 'temperature': '60'}, {'action': 'reboot'}):
+            response = self.client.post('/api/actions', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+        response = self.client.post('/api/actions', {'action': 'pause', 'printers': [self.printer.id]})
+        self.assertEqual(response.status_code, 415)
+        run_action.assert_not_called()
+        response = self.client.post('/api/actions', {'action': 'preheat', 'printers': [self.printer.id],
+                                                     'temperature': 60}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        run_action.assert_called_once_with([self.printer], 'preheat', temperature=60)
+
+
+class WatchSchedulerTests(SimpleTestCase):
+    """
+    Watched urls are fetched concurrently and classified together
+    """
+
+    def test_slow_fetches_run_concurrently(self):
+        urls = [f'http://camera{i}' for i in range(6)]
+        # passes only when every watch is fetched at the same time
+        barrier = threading.Barrier(len(urls), timeout=5)
+        results, done = [], threading.Event()
+
+        def fetch(url):
+            barrier.wait()
+            return np.zeros((1, 1, 3), dtype=np.uint8)
+
+        def classify(frames, frame_urls):
+            self.assertEqual(len(frames), len(frame_urls))
+            return ['stringing'] * len(frames)
+
+        def callback(error, metadata):
+            results.append((error, metadata))
+            if len(results) == len(urls):
+                done.set()
+
+        scheduler = WatchScheduler(fetch, classify)
+        self.addCleanup(scheduler.shutdown)
+        for url in urls:
+            scheduler.add(url, callback, url, delay=0.1)
+        self.assertTrue(done.wait(5))
+        self.assertEqual(sorted(metadata for _, metadata in results[:len(urls)]), urls)
+
+    def test_removed_url_is_not_fetched(self):
+        fetched = []
+        scheduler = WatchScheduler(fetched.append, lambda frames, urls: [''] * len(frames))
+        self.addCleanup(scheduler.shutdown)
+        scheduler.add('http://camera', delay=0.05)
+        scheduler.remove('http://camera')
+        time.sleep(0.2)
+        self.assertEqual(fetched, [])
+        self.assertEqual(scheduler.watches, {})
+
+
+class InferenceBatcherTests(SimpleTestCase):
+    """
+    Tiles of concurrent callers are merged into one model call and split back
+    """
+
+    def test_requests_merged_into_one_batch(self):
+        calls = []
+
+        def predict(x):
+            calls.append(len(x))
+            return x[:, :1] * 2
+
+        batcher = InferenceBatcher(predict, max_batch=6, max_latency=5)
+        self.addCleanup(batcher.close)
+        inputs = [np.full((n, 1), n, dtype=np.float32) for n in (1, 2, 3)]
+        futures = [batcher.submit(tiles) for tiles in inputs]
+        for tiles, future in zip(inputs, futures):
+            np.testing.assert_array_equal(future.result(5), tiles * 2)
+        # full batch is flushed at once, without waiting for max_latency
+        self.assertEqual(calls, [6])
+
+    def test_flush_after_max_latency(self):
+        batcher = InferenceBatcher(lambda x: x, max_batch=256, max_latency=0.01)
+        self.addCleanup(batcher.close)
+        np.testing.assert_array_equal(batcher.submit(np.ones((2, 1))).result(5), np.ones((2, 1)))
+        self.assertEqual(len(batcher.submit(np.empty((0, 1))).result(5)), 0)
+
+    def test_model_error_passed_to_every_caller(self):
+        batcher = InferenceBatcher(mock.Mock(side_effect=ValueError('broken model')), max_batch=2, max_latency=5)
+        self.addCleanup(batcher.close)
+        futures = [batcher.submit(np.ones((1, 1))) for _ in range(2)]
+        for future in futures:
+            self.assertRaises(ValueError, future.result, 5)
+
+    def test_closed_batcher_rejects_tiles(self):
+        batcher = InferenceBatcher(lambda x: x)
+        future = batcher.submit(np.ones((1, 1)))
+        batcher.close()
+        # queued requests are flushed before the thread stops
+        self.assertEqual(len(future.result(0)), 1)
+        self.assertRaises(RuntimeError, batcher.submit, np.ones((1, 1)))
+
+
+class MultipartParserTests(SimpleTestCase):
+    """
+    Frames of MJPEG stream are parsed from chunks split at any byte
+    """
+
+    @staticmethod
+    def part(frame: bytes, length: bool = True) -> bytes:
+        headers = b'--frame\r\nContent-Type: image/jpeg\r\n'
+        if length:
+            headers += b'Content-Length: %d\r\n' % len(frame)
+        return headers + b'\r\n' + frame + b'\r\n'
+
+    def test_split_chunks(self):
+        body = self.part(b'first') + self.part(b'second')
+        for size in (1, 3, 7):
+            parser = MultipartParser(get_boundary('multipart/x-mixed-replace; boundary="frame"'))
+            frames = [parser.feed(body[i:i + size]) for i in range(0, len(body), size)]
+            self.assertEqual([frame for frame in frames if frame], [b'first', b'second'], size)
+
+    def test_only_latest_frame_of_chunk(self):
+        parser = MultipartParser('frame')
+        self.assertEqual(parser.feed(self.part(b'old') + self.part(b'new')), b'new')
+        self.assertIsNone(parser.feed(b'--fr'))
+
+    def test_part_without_content_length(self):
+        parser = MultipartParser('--frame')
+        # without length the part ends at the next boundary
+        self.assertIsNone(parser.feed(self.part(b'jpeg', length=False)))
+        self.assertEqual(parser.feed(b'--frame\r\n'), b'jpeg')
+
+    def test_missing_boundary(self):
+        self.assertRaises(ValueError, get_boundary, 'multipart/x-mixed-replace')
+
+
+@mock.patch('ui_3d_app.clients.UL', side_effect=lambda **kwargs: mock.Mock())
+class ClientRegistryTests(SimpleTestCase):
+    """
+    Clients are cached per printer and credentials, offline printers are backed off
+    """
+
+    def setUp(self):
+        self.printer = Printers(id=1, name='Printer', address='10.0.0.1', api_id='1', api_key='1')
+
+    def test_cached_until_credentials_change(self, UL):
+        registry = ClientRegistry()
+        client = registry.get(self.printer)
+        self.assertIs(registry.get(self.printer), client)
+        self.printer.api_key = '2'
+        self.assertIsNot(registry.get(self.printer), client)
+        self.assertEqual(registry.stats(), {'hits': 1, 'misses': 2, 'negative_hits': 0, 'size': 1})
+        # replaced client may still be used by another request
+        client.close.assert_not_called()
+
+    def test_expired_client_rebuilt(self, UL):
+        registry = ClientRegistry(ttl=0)
+        client = registry.get(self.printer)
+        self.assertIsNot(registry.get(self.printer), client)
+        client.close.assert_not_called()
+
+    def test_least_recently_used_evicted(self, UL):
+        registry = ClientRegistry(maxsize=2)
+        printers = [Printers(id=i, address=f'10.0.0.{i}', api_id=str(i), api_key=str(i)) for i in range(3)]
+        clients = [registry.get(db_printer) for db_printer in printers[:2]]
+        registry.get(printers[0])
+        registry.get(printers[2])
+        self.assertIs(registry.get(printers[0]), clients[0])
+        self.assertIsNot(registry.get(printers[1]), clients[1])
+
+    def test_backoff_grows_until_success(self, UL):
+        registry = ClientRegistry(backoff=5, max_backoff=12)
+        with mock.patch('ui_3d_app.clients.monotonic', return_value=0):
+            registry.get(self.printer)
+            registry.report_failure(self.printer)
+            self.assertIsNone(registry.get(self.printer))
+        with mock.patch('ui_3d_app.clients.monotonic', return_value=5):
+            self.assertIsNotNone(registry.get(self.printer))
+            registry.report_failure(self.printer)
+            self.assertEqual(registry._entries[self.printer.id].expires_at, 15)
+        with mock.patch('ui_3d_app.clients.monotonic', return_value=15):
+            registry.get(self.printer)
+            registry.report_failure(self.printer)
+            # capped by max_backoff
+            self.assertEqual(registry._entries[self.printer.id].expires_at, 27)
+        with mock.patch('ui_3d_app.clients.monotonic', return_value=27):
+            registry.get(self.printer)
+            registry.report_success(self.printer)
+            registry.report_failure(self.printer)
+            self.assertEqual(registry._entries[self.printer.id].expires_at, 32)
+        self.assertEqual(registry.negative_hits, 1)
+
+
+class LogSinkTests(TestCase):
+    """
+    Queued messages are merged and written with one bulk insert
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.printer = Printers.objects.create(name='Printer', address='10.0.0.1', api_id='1', api_key='1')
+
+    def test_repeated_messages_merged(self):
+        sink = LogSink(limit=2)
+        for _ in range(3):
+            sink.write(self.printer.id, 'Stringing', 'error')
+        sink.write(self.printer.id, 'Print started')
+        sink.write(self.printer.id, 'Dropped, queue is full')
+        self.assertEqual(Logs.objects.count(), 0)
+        with CaptureQueriesContext(connection) as context:
+            sink.flush()
+        self.assertEqual(len([query for query in context.captured_queries if query['sql'].startswith('INSERT')]), 1)
+        self.assertEqual(list(Logs.objects.order_by('id').values_list('type', 'message')),
+                         [('error', 'Stringing (×3)'), ('info', 'Print started')])
+        self.assertEqual(sink.dropped, 0)
+
+    def test_messages_of_deleted_printer_skipped(self):
+        sink = LogSink()
+        sink.write(self.printer.id + 1, 'Message')
+        sink.write(self.printer.id, 'Message')
+        sink.flush()
+        self.assertEqual(list(Logs.objects.values_list('printer_id', flat=True)), [self.printer.id])
+        with self.assertNumQueries(0):
+            sink.flush()
+
+
+@mock.patch('ui_3d_app.retention.sleep')
+class RetentionTests(TestCase):
+    """
+    Old logs are rolled up and deleted in batches, a busy database is retried
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        printer = Printers.objects.create(name='Printer', address='10.0.0.1', api_id='1', api_key='1')
+        Logs.objects.bulk_create([Logs(printer_id=printer, message=f'Message {i}') for i in range(5)])
+        Logs.objects.filter(id__in=Logs.objects.order_by('id').values('id')[:3]) \
+            .update(created_at=timezone.now() - timedelta(days=retention.RETENTION_DAYS + 1))
+
+    def test_old_logs_rolled_up(self, sleep):
+        self.assertEqual(retention.prune_logs(batch_size=2), 3)
+        self.assertEqual(Logs.objects.count(), 2)
+        self.assertEqual(LogsRollup.objects.get().count, 3)
+
+    def test_busy_batch_retried(self, sleep):
+        prune_batch = retention._prune_batch
+        errors = [OperationalError('database is locked')]
+
+        def flaky_batch(*args):
+            if errors:
+                raise errors.pop()
+            return prune_batch(*args)
+
+        with mock.patch('ui_3d_app.retention._prune_batch', side_effect=flaky_batch) as batch:
+            self.assertEqual(retention.prune_logs(), 3)
+        self.assertEqual(batch.call_count, 2)
+        self.assertEqual(LogsRollup.objects.get().count, 3)
+
+    @mock.patch('ui_3d_app.retention._prune_batch', side_effect=OperationalError('database is locked'))
+    def test_busy_database_gives_up(self, batch, sleep):
+        self.assertRaises(OperationalError, retention.prune_logs)
+        self.assertEqual(batch.call_count, retention.RETENTION_RETRIES)
+
+
+class FrameDecoderTests(SimpleTestCase):
+    """
+    Frames are decoded into pooled buffers and normalized without copies
+    """
+
+    @staticmethod
+    def encode(img: np.ndarray, format: str = 'PNG') -> bytes:
+        out = BytesIO()
+        Image.fromarray(img).save(out, format)
+        return out.getvalue()
+
+    def setUp(self):
+        self.img = np.random.default_rng(0).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+
+    def test_decoded_pixels(self):
+        frame = FrameDecoder().decode(self.encode(self.img))
+        self.assertEqual(frame.shape, (48, 64, 3))
+        np.testing.assert_array_equal(frame, self.img)
+        grey = FrameDecoder().decode(self.encode(self.img[..., 0]))
+        np.testing.assert_array_equal(grey, np.repeat(self.img[..., :1], 3, axis=2))
+
+    def test_released_buffer_reused(self):
+        decoder = FrameDecoder()
+        raw = self.encode(self.img)
+        frame = decoder.decode(raw)
+        decoder.release(frame)
+        decoder.release(frame)
+        self.assertIs(decoder.decode(raw).base, frame.base)
+        # buffer is in use again, so the next frame gets a new one
+        self.assertIsNot(decoder.decode(raw).base, frame.base)
+        decoder.release(self.img)
+
+    def test_jpeg_reduced_by_draft(self):
+        frame = FrameDecoder((32, 24)).decode(self.encode(self.img, 'JPEG'))
+        self.assertEqual(frame.shape, (24, 32, 3))
+
+    def test_normalize(self):
+        # strided view, like tiles split from a frame
+        tiles = self.img[::2, ::2]
+        out = np.empty(tiles.shape, dtype=np.float32)
+        self.assertIs(normalize(tiles, out), out)
+        np.testing.assert_allclose(out, (255 - tiles.astype(np.float32)) / 255, atol=1e-6)
+
+
+class TileCacheTests(SimpleTestCase):
+    """
+    Only tiles that changed since they were classified are classified again
+    """
+
+    def setUp(self):
+        self.cache = TileCache()
+        # 2 x 3 tiles
+        self.frame = np.random.default_rng(0).integers(0, 200, (2 * TILE_SIZE, 3 * TILE_SIZE, 3), dtype=np.uint8)
+        signatures, mask = self.cache.changed('camera', self.frame)
+        self.assertTrue(mask.all())
+        self.labels = self.cache.update('camera', signatures, mask, np.arange(6))
+
+    def test_unchanged_frame_reuses_classes(self):
+        # sensor noise is averaged out by block means
+        signatures, mask = self.cache.changed('camera', self.frame + np.uint8(3))
+        self.assertFalse(mask.any())
+        np.testing.assert_array_equal(self.cache.update('camera', signatures, mask, np.empty(0)), np.arange(6))
+        self.assertEqual((self.cache.tiles_total, self.cache.tiles_skipped), (12, 6))
+
+    def test_local_change_detected(self):
+        frame = self.frame.copy()
+        # thin string in the middle of tile (1, 2)
+        frame[TILE_SIZE + 40:TILE_SIZE + 42, 2 * TILE_SIZE + 10:2 * TILE_SIZE + 60] = 255
+        signatures, mask = self.cache.changed('camera', frame)
+        self.assertEqual(list(zip(*np.nonzero(mask))), [(1, 2)])
+        np.testing.assert_array_equal(self.cache.update('camera', signatures, mask, np.array([2])),
+                                      [0, 1, 2, 3, 4, 2])
+
+    def test_forgotten_or_resized_source_classified(self):
+        self.assertTrue(self.cache.changed('camera', self.frame[:TILE_SIZE])[1].all())
+        self.assertTrue(self.cache.changed('other', self.frame)[1].all())
+        self.cache.forget('camera')
+        self.assertTrue(self.cache.changed('camera', self.frame)[1].all())
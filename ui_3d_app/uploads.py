@@ -0,0 +1,139 @@
+import io
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from time import monotonic
+
+from django.core.files.uploadedfile import UploadedFile
+
+from ui_3d_app.logsink import sink
+from ui_3d_app.models import Printers
+from ui_3d_app.utils import get_printer
+
+UPLOAD_WORKERS = 8  # max files sent to printers at the same time
+UPLOAD_TTL = 60 * 60  # seconds progress of a finished upload is kept
+
+logger = logging.getLogger(__name__)
+_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='uploads')
+
+
+@dataclass
+class PrinterUpload():
+    """
+    Progress of sending file to one printer
+
+    Attributes:
+        printer_id (int): printer id in database
+        name (str): printer name
+        sent (int): bytes sent
+        total (int): bytes to send, 0 until the upload starts
+        state (str): 'pending', 'uploading', 'done' or 'error'
+        error (str): error message if state is 'error'
+    """
+    printer_id: int
+    name: str
+    sent: int = 0
+    total: int = 0
+    state: str = 'pending'
+    error: str = ''
+
+
+@dataclass
+class UploadTask():
+    """
+    One G-code file sent to several printers
+
+    Attributes:
+        id (str): upload id used by progress endpoint
+        job_name (str): name of print job
+        filename (str): name of uploaded file
+        printers (list[PrinterUpload]): progress of every printer
+        created_at (float): monotonic time of start
+    """
+    id: str
+    job_name: str
+    filename: str
+    printers: list[PrinterUpload] = field(default_factory=list)
+    created_at: float = field(default_factory=monotonic)
+
+    @property
+    def done(self) -> bool:
+        return all(printer.state in ('done', 'error') for printer in self.printers)
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        del data['created_at']
+        data['done'] = self.done
+        return data
+
+
+uploads: dict[str, UploadTask] = {}
+_lock = threading.Lock()
+
+
+def start_upload(printers: list[Printers], job_name: str, file: UploadedFile) -> UploadTask:
+    """
+    Starts sending uploaded file to printers in background
+
+    Every printer reads the file through its own handle opened here, so the
+    file may be deleted by Django after the request without breaking uploads.
+
+    Args:
+        printers (list[models.Printers]): printers info from database
+        job_name (str): name of print job
+        file (UploadedFile): uploaded G-code, preferably stored on disk (TemporaryUploadedFile)
+
+    Returns:
+        UploadTask: progress of the upload
+    """
+    task = UploadTask(uuid.uuid4().hex, job_name, file.name,
+                      [PrinterUpload(db_printer.id, db_printer.name) for db_printer in printers])
+    with _lock:
+        for upload_id, old in list(uploads.items()):
+            if old.done and monotonic() - old.created_at > UPLOAD_TTL:
+                del uploads[upload_id]
+        uploads[task.id] = task
+    if hasattr(file, 'temporary_file_path'):
+        path = file.temporary_file_path()
+        handles = [open(path, 'rb') for _ in printers]
+    else:
+        # small files are kept in memory by Django, buffers share the same bytes
+        file.seek(0)
+        content = file.read()
+        handles = [io.BytesIO(content) for _ in printers]
+    for db_printer, progress, handle in zip(printers, task.printers, handles):
+        _executor.submit(_send, db_printer, task, progress, handle)
+    return task
+
+
+def get_upload(upload_id: str) -> UploadTask | None:
+    """
+    Args:
+        upload_id (str): id returned by start_upload
+
+    Returns:
+        UploadTask | None: upload progress or None if it is unknown
+    """
+    return uploads.get(upload_id)
+
+
+def _send(db_printer: Printers, task: UploadTask, progress: PrinterUpload, handle):
+    def report(sent: int, total: int):
+        progress.sent, progress.total = sent, total
+
+    try:
+        progress.state = 'uploading'
+        api_printer = get_printer(db_printer)
+        if not api_printer:
+            raise ConnectionError('Принтер не подключён')
+        api_printer.post_print_job(task.job_name, handle, report, task.filename)
+        progress.state = 'done'
+        sink.write(db_printer.id, f'Файл {task.filename} отправлен на печать', 'info')
+    except Exception as exc:
+        logger.error(f'Failed to upload {task.filename} to printer {db_printer.address}: {exc}')
+        progress.state, progress.error = 'error', str(exc)
+        sink.write(db_printer.id, f'Не удалось отправить файл {task.filename}: {exc}', 'error')
+    finally:
+        handle.close()
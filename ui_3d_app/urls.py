@@ -1,7 +1,7 @@
 from django.urls import path
 from django.views.generic import RedirectView
 
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', RedirectView.as_view(url='index')),
@@ -11,6 +11,16 @@ urlpatterns = [
     path('control/<int:printer_id>', views.control, name='control'),
     path('camera', views.camera, name='camera'),
     path('camera/<int:printer_id>', views.camera, name='camera'),
+    path('camera_stream/<int:printer_id>', views.camera_stream, name='camera_stream'),
+    path('live/<int:printer_id>', views.live, name='live'),
+    path('fleet', views.fleet, name='fleet'),
+    path('upload', views.upload, name='upload'),
     path('about', views.about, name='about'),
     path('new_printer', views.new_printer, name='new_printer'),
+    path('api/printers', api.printers, name='api_printers'),
+    path('api/actions', api.actions, name='api_actions'),
+    path('api/uploads/<str:upload_id>', api.uploads, name='api_uploads'),
+    path('api/printers/<int:printer_id>/status', api.status, name='api_status'),
+    path('api/printers/<int:printer_id>/parameters', api.parameters, name='api_parameters'),
+    path('api/printers/<int:printer_id>/logs', api.logs, name='api_logs'),
 ]
@@ -1,19 +1,49 @@
 import logging
-from collections import namedtuple
-from functools import lru_cache
+from collections import Counter, namedtuple
+from datetime import timedelta
 from os import getenv
 
 import regex
 import requests
 
 from printer import Ultimaker as UL
-from ui_3d_app.models import Logs, Printers, Users
+from ui_3d_app.clients import registry
+from ui_3d_app.logsink import sink
+from ui_3d_app.models import Printers, Users
+from ui_3d_app.telemetry import Snapshot, poller
 
 logging.basicConfig(level=logging.DEBUG)
 
 
 MenuItem = namedtuple('MenuItem', ['id', 'name'])
 
+MENU_DEADLINE = 3  # seconds to wait for all printer states in the menu
+FLEET_DEADLINE = 3  # seconds to wait for all printer states in the fleet overview
+UNKNOWN_STATE = 'Неизвестно'
+
+STATUS_LABELS = {
+    'name': 'Название',
+    'state': 'Статус',
+    'progress': 'Прогресс',
+    'started': 'Запущена',
+    'elapsed': 'Прошло времени',
+    'left': 'Осталось времени',
+    'temp_nozzle': 'Температура сопла',
+    'temp_bed': 'Температура стола',
+    'fan': 'Скорость вентилятора',
+    'source': 'Источник',
+}
+
+FLEET_COLUMNS = {
+    'name': 'Принтер',
+    'state': 'Статус',
+    'progress': 'Прогресс',
+    'eta': 'Завершение',
+    'temp_nozzle': 'Сопло, °C',
+    'temp_bed': 'Стол, °C',
+    'updated_at': 'Обновлено',
+}
+
 ABOUT_TEXT = """
 <p><b>Последнее обновление:</b> 2023-04-18<br></p>
 <p><b>Контакты:</b><br>
@@ -36,39 +66,38 @@ STATES = {
     'wait_user_action': 'Ожидание действия',
 }
 
-@lru_cache(maxsize=1)
+# fleet filter values besides print job states of STATES
+FLEET_MODES = {
+    'idle': 'Ожидание',
+    'offline': 'Принтер не подключён',
+    'unknown': UNKNOWN_STATE,
+}
+
 def get_printer(db_printer: Printers) -> UL | None:
     """
-    Creates instance of Ultimaker printer based on database info
+    Gets instance of Ultimaker printer based on database info from client registry
 
     Args:
         db_printer (models.Printers): printer info from database
     
     Returns:
-        printer.Ultimaker: instance of Ultimaker printer
+        printer.Ultimaker: instance of Ultimaker printer, None if printer is offline and waits for retry
     """
-    try:
-        return UL(ip=db_printer.address, credentials=db_printer.get_credentials(), timeout=5)
-    except Exception as exc:
-        logging.error(f'Failed to connect to printer: {exc}')
-        Logs(printer_id=db_printer,
-             message=f'Ошибка при работе с принтером: {exc}', type='error').save()
-        return None
+    return registry.get(db_printer)
 
 
 # todo: запуск логирования
 # todo: остановка логирования при удалении принтера
 def log_error(error: str, printer_id: str) -> None:
     """
-    Logs error to database
+    Queues error for batched write to database
 
     Args:
         error (str): error message
         metadata (str): additional info
     """
-    printer = Printers.objects.get(id=printer_id)
     msg = f'Ошибка печати: {error}'
-    Logs(printer_id=printer, message=msg, type='error').save()
+    sink.write(printer_id, msg, 'error')
 
 
 def get_joke() -> str:
@@ -104,30 +133,51 @@ def get_printer_status(db_printer: Printers) -> str:
     Returns:
         str: formatted printer status
     """
-    api_printer = get_printer(db_printer)
-    if not api_printer:
+    snapshot = poller.get(db_printer)
+    if not snapshot.connected:
         return '<p>Принтер не подключён</p>'
-    params = api_printer.get_printer()
-    print_job = api_printer.get_print_job()
-    if 'state' not in print_job or print_job['state'] not in STATES:
+    fields = get_status_fields(snapshot)
+    if not fields:
         return '<p>Принтер в режиме ожидания</p>'
+    # spans are updated in place by live.js
+    return ''.join(f'<p>{label}: <span data-live="{key}">{fields[key]}</span></p>'
+                   for key, label in STATUS_LABELS.items())
+
+
+def get_status_fields(snapshot) -> dict:
+    """
+    Gets formatted values of the current print job from cached telemetry
+
+    Args:
+        snapshot (telemetry.Snapshot): cached printer documents
+
+    Returns:
+        dict: values by STATUS_LABELS keys, empty if printer is offline or idle
+    """
+    if not snapshot.connected:
+        return {}
+    params = snapshot.printer
+    print_job = snapshot.print_job
+    if 'state' not in print_job or print_job['state'] not in STATES:
+        return {}
     elapsed = f'{print_job["time_elapsed"] // 3600:02d}:' \
         f'{print_job["time_elapsed"] % 3600 // 60:02d}:' \
         f'{print_job["time_elapsed"] % 60:02d}'
     left = f'{(print_job["time_total"] - print_job["time_elapsed"]) // 3600:02d}:' \
         f'{(print_job["time_total"] - print_job["time_elapsed"]) % 3600 // 60:02d}:' \
         f'{(print_job["time_total"] - print_job["time_elapsed"]) % 60:02d}'
-    status = f'<p>Название: {print_job["name"]}</p>' \
-        f'<p>Статус: {STATES[print_job["state"]]}</p>' \
-        f'<p>Прогресс: {round(print_job["progress"]*100, 2)}%</p>' \
-        f'<p>Запущена: {print_job["datetime_started"]}</p>' \
-        f'<p>Прошло времени: {elapsed}</p>' \
-        f'<p>Осталось времени: {left}</p>' \
-        f'<p>Температура сопла: {params["heads"][0]["extruders"][0]["hotend"]["temperature"]["current"]}</p>' \
-        f'<p>Температура стола: {params["bed"]["temperature"]["current"]}</p>' \
-        f'<p>Скорость вентилятора: {params["heads"][0]["fan"]}</p>' \
-        f'<p>Источник: {print_job["source"]}</p>'
-    return status
+    return {
+        'name': print_job['name'],
+        'state': STATES[print_job['state']],
+        'progress': f'{round(print_job["progress"]*100, 2)}%',
+        'started': print_job['datetime_started'],
+        'elapsed': elapsed,
+        'left': left,
+        'temp_nozzle': params['heads'][0]['extruders'][0]['hotend']['temperature']['current'],
+        'temp_bed': params['bed']['temperature']['current'],
+        'fan': params['heads'][0]['fan'],
+        'source': print_job['source'],
+    }
 
 
 def get_printer_state(db_printer: Printers) -> str:
@@ -140,21 +190,34 @@ def get_printer_state(db_printer: Printers) -> str:
     Returns:
         str: printer status name
     """
-    api_printer = get_printer(db_printer)
-    if not api_printer:
+    return snapshot_state(poller.get(db_printer))
+
+
+def snapshot_state(snapshot) -> str:
+    """
+    Gets name of printer system status from cached telemetry
+
+    Args:
+        snapshot (telemetry.Snapshot): cached printer documents
+
+    Returns:
+        str: printer status name
+    """
+    if not snapshot.connected:
         return 'Принтер не подключён'
-    print_job = api_printer.get_print_job()
+    print_job = snapshot.print_job
     if 'state' not in print_job:
         return 'Ожидание'
     return STATES.get(print_job['state'], 'Не подключён')
 
 
-def get_printer_parameters(db_printer: Printers) -> dict:
+def get_printer_parameters(db_printer: Printers, snapshot: Snapshot | None = None) -> dict:
     """
     Gets printer temperatures, head position and extruder parameters from Ultimaker API
 
     Args:
         db_printer (models.Printers): printer info from database
+        snapshot (telemetry.Snapshot | None): cached printer state already loaded by caller
 
     Returns:
         dict: actual printer parameters
@@ -172,10 +235,10 @@ def get_printer_parameters(db_printer: Printers) -> dict:
             'current_extruder_target_acceleration': '',
             'current_extruder_target_jerk': '',
         }
-    api_printer = get_printer(db_printer)
-    if not api_printer:
+    snapshot = snapshot or poller.get(db_printer)
+    if not snapshot.connected:
         return data
-    params = api_printer.get_printer()
+    params = snapshot.printer
     data['current_temp_nozzle'] = params['heads'][0]['extruders'][0]['hotend']['temperature']['target']
     data['current_temp_bed'] = params['bed']['temperature']['target']
     data['current_head_max_speed'] = params['heads'][0]['max_speed']['x']
@@ -202,23 +265,102 @@ def get_printer_info(db_printer: Printers) -> str:
     Returns:
         str: formatted printer info
     """
-    api_printer = get_printer(db_printer)
-    if not api_printer:
+    snapshot = poller.get(db_printer)
+    if not snapshot.connected:
         return 'Принтер не подключён'
-    data = api_printer.get_system()
+    data = dict(snapshot.system)
     data.pop('log', None)
     info = ''
     for key, value in data.items():
         info += f'<p>{key}: {value}</p>'
     return info
 
-def get_menu_items() -> list[MenuItem]:
+def get_menu_items(printers: list[Printers] | None = None) -> list[MenuItem]:
+    """
+    Gets printers for the side menu with their states from telemetry cache
+
+    Printers that were never polled wait for the first poll at most MENU_DEADLINE
+    seconds in total and are shown with unknown state if it did not finish
+
+    Args:
+        printers (list[models.Printers] | None): printers ordered by id, loaded from database if not given
+
+    Returns:
+        list[MenuItem]: printer ids and names with states
+    """
+    if printers is None:
+        printers = list(Printers.objects.all().order_by('id'))
     items = []
-    for printer in Printers.objects.all().order_by('id'):
-        state = get_printer_state(printer)
+    for printer, snapshot in zip(printers, poller.get_many(printers, MENU_DEADLINE)):
+        if snapshot.connected or snapshot.error:
+            state = snapshot_state(snapshot)
+        else:
+            state = UNKNOWN_STATE
         if state:
             name = f'{printer.name} — {state}'
         else:
             name = printer.name
         items.append(MenuItem(printer.id, name))
     return items
+
+
+def get_fleet(printers: list[Printers], mode: str = '', sort: str = 'name') -> tuple[list[dict], Counter]:
+    """
+    Gets state, progress, ETA and temperatures of every printer from telemetry cache
+
+    Printers that were never polled are polled concurrently and waited for at most
+    FLEET_DEADLINE seconds in total, the rest are shown with unknown state
+
+    Args:
+        printers (list[models.Printers]): printers info from database
+        mode (str): print job state key, 'idle', 'offline' or 'unknown' to show only such printers, all if empty
+        sort (str): one of FLEET_COLUMNS keys, descending if prefixed with '-'
+
+    Returns:
+        tuple[list[dict], Counter]: table rows and number of printers by mode
+    """
+    rows = []
+    for printer, snapshot in zip(printers, poller.get_many(printers, FLEET_DEADLINE)):
+        row = {
+            'id': printer.id,
+            'name': printer.name,
+            'mode': 'unknown',
+            'state': UNKNOWN_STATE,
+            'progress': None,
+            'eta': None,
+            'temp_nozzle': None,
+            'temp_nozzle_target': None,
+            'temp_bed': None,
+            'temp_bed_target': None,
+            'updated_at': snapshot.updated_at,
+        }
+        if snapshot.connected:
+            print_job = snapshot.print_job
+            head = snapshot.printer['heads'][0]['extruders'][0]['hotend']['temperature']
+            bed = snapshot.printer['bed']['temperature']
+            row.update({
+                'mode': print_job.get('state', 'idle'),
+                'state': snapshot_state(snapshot),
+                'temp_nozzle': head['current'],
+                'temp_nozzle_target': head['target'],
+                'temp_bed': bed['current'],
+                'temp_bed_target': bed['target'],
+            })
+            if 'state' in print_job:
+                row['progress'] = round(print_job['progress'] * 100, 1)
+                left = max(print_job['time_total'] - print_job['time_elapsed'], 0)
+                row['eta'] = snapshot.updated_at + timedelta(seconds=left)
+        elif snapshot.error:
+            row['mode'] = 'offline'
+            row['state'] = snapshot_state(snapshot)
+        rows.append(row)
+    counts = Counter(row['mode'] for row in rows)
+    if mode:
+        rows = [row for row in rows if row['mode'] == mode]
+    key = sort.removeprefix('-')
+    if key in FLEET_COLUMNS:
+        # printers without the value always go last
+        present = sorted((row for row in rows if row[key] is not None),
+                         key=lambda row: row[key], reverse=sort.startswith('-'))
+        rows = present + [row for row in rows if row[key] is None]
+    return rows, counts
@@ -1,44 +1,60 @@
 import logging
 from os import getenv
 
-from django.http import HttpResponse
-from django.shortcuts import render
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import redirect, render
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
 from printer import Ultimaker as UL
 from ui_3d_app.models import Logs, Printers, Users
+from ui_3d_app import actions as bulk_actions
+from ui_3d_app import uploads
+from ui_3d_app.forms import PostPrintJobForm
+from ui_3d_app import camera as camera_relay
+from ui_3d_app import live as live_updates
 from  ui_3d_app import utils
+from ui_3d_app.telemetry import poller
 
 logging.basicConfig(level=logging.DEBUG)
 
 
 def check_db_printer(view):
+    """
+    Resolves printer of the view with one query
+
+    The view gets the printer instance and the list of all printers for the
+    side menu instead of the id, so neither has to be loaded again
+    """
     def wrapper(request, printer_id: int | None = None):
         logging.debug(
             f'"{view.__name__}" view called with {printer_id=}, {request=}')
-        if Printers.objects.count() == 0:
+        printers = list(Printers.objects.order_by('id'))
+        if not printers:
             if not getenv('DEBUG', False):
                 return new_printer(request)
             logging.debug('Debug mode is on, creating test printer')
-            Printers(name='Test printer', address='123',
-                     api_id='123', api_key='123').save()
+            test_printer = Printers(name='Test printer', address='123',
+                                    api_id='123', api_key='123')
+            test_printer.save()
+            printers = [test_printer]
         if not printer_id:
-            printer_id = Printers.objects.order_by('id').first().id
+            printer_id = printers[0].id
             logging.debug(f'Assigned {printer_id=} to "{view.__name__}" view')
-        try:
-            Printers.objects.get(id=printer_id)
-        except Printers.DoesNotExist:
+        db_printer = next((printer for printer in printers if printer.id == int(printer_id)), None)
+        if db_printer is None:
             return HttpResponse('Printer not found', status=404)
-        return view(request, printer_id)
+        return view(request, db_printer, printers)
     return wrapper
 
 
 @csrf_exempt
 @check_db_printer
-def index(request, printer_id: int):
-    db_printer = Printers.objects.get(id=printer_id)
-    logs = Logs.objects.filter(
-        printer_id=printer_id).order_by('-created_at')[:100]
+def index(request, db_printer: Printers, printers: list[Printers]):
+    logs = Logs.objects.filter(printer_id=db_printer.id) \
+        .select_related('printer_id').order_by('-created_at')[:100]
     params = {
         'selected_printer': {
             'id': db_printer.id,
@@ -46,8 +62,9 @@ def index(request, printer_id: int):
             'logs': logs,
             'status': utils.get_printer_status(db_printer),
             'state': utils.get_printer_state(db_printer),
+            'updated_at': poller.get(db_printer).updated_at,
         },
-        'printers': utils.get_menu_items(),
+        'printers': utils.get_menu_items(printers),
     }
     current_parameters = utils.get_printer_parameters(db_printer)
     params = {**params, **current_parameters}
@@ -69,29 +86,22 @@ def index(request, printer_id: int):
         temperature = float(request.POST.get('temp_bed', None))
         request.POST = {}
         api_printer.set_bed_temperature(temperature)
-    if 'pause' in request.POST:
-        logging.debug(f'{request.POST=}')
-        api_printer.set_print_job_state('pause')
-        api_printer.put_printer_led(100, 100, 60)
-        request.POST = {}
-    if 'resume' in request.POST:
-        logging.debug(f'{request.POST=}')
-        api_printer.set_print_job_state('print')
-        api_printer.put_printer_led(100, 100, 120)
-        request.POST = {}
-    if 'abort' in request.POST:
-        logging.debug(f'{request.POST=}')
-        api_printer.set_print_job_state('abort')
-        api_printer.put_printer_led(100, 100, 0)
-        request.POST = {}
+    for action in bulk_actions.JOB_ACTIONS:
+        if action in request.POST:
+            logging.debug(f'{request.POST=}')
+            result = bulk_actions.run_action([db_printer], action)[0]
+            request.POST = {}
+            if not result.ok:
+                params['selected_printer']['status'] = f'<p>{result.error}</p>'
+                return render(request, 'ui_3d_app/index.html', params)
+    poller.refresh(db_printer)
     params['status'] = utils.get_printer_status(db_printer)
     return render(request, 'ui_3d_app/index.html', params)
 
 
 @csrf_exempt
 @check_db_printer
-def control(request, printer_id: int | None = None):
-    db_printer = Printers.objects.get(id=printer_id)
+def control(request, db_printer: Printers, printers: list[Printers]):
     if 'delete' in request.POST:
         db_printer.delete()
         request.POST = {}
@@ -110,7 +120,7 @@ def control(request, printer_id: int | None = None):
             'name': db_printer.name,
             'ip': db_printer.address,
         },
-        'printers': utils.get_menu_items(),
+        'printers': utils.get_menu_items(printers),
         'data': utils.get_printer_info(db_printer),
     }
     return render(request, 'ui_3d_app/control.html', params)
@@ -118,11 +128,9 @@ def control(request, printer_id: int | None = None):
 
 @csrf_exempt
 @check_db_printer
-def camera(request, printer_id: int | None = None):
-    db_printer = Printers.objects.get(id=printer_id)
-    api_printer = utils.get_printer(db_printer)
-    if api_printer:
-        url = api_printer.get_camera_feed().get('url', '/static/ui_3d_app/404_camera.jpeg')
+def camera(request, db_printer: Printers, printers: list[Printers]):
+    if camera_relay.get_relay(db_printer):
+        url = f'/camera_stream/{db_printer.id}'
     else:
         url = '/static/ui_3d_app/404_camera.jpeg'
     params = {
@@ -130,13 +138,94 @@ def camera(request, printer_id: int | None = None):
             'id': db_printer.id,
             'name': db_printer.name,
         },
-        'printers': utils.get_menu_items(),
+        'printers': utils.get_menu_items(printers),
         'url': url,
     }
     logging.debug(f'{params=}')
     return render(request, 'ui_3d_app/camera.html', params)
 
 
+@csrf_exempt
+def fleet(request):
+    mode = request.GET.get('state', '')
+    sort = request.GET.get('sort', 'name')
+    printers = list(Printers.objects.order_by('id'))
+    report = []
+    action = request.POST.get('action')
+    if action in bulk_actions.ACTION_LABELS:
+        selected = set(request.POST.getlist('printers'))
+        report = bulk_actions.run_action([printer for printer in printers if str(printer.id) in selected],
+                                         action, temperature=request.POST.get('temperature', 60))
+    rows, counts = utils.get_fleet(printers, mode, sort)
+    # the sorted column link switches direction
+    columns = [(label, f'-{key}' if sort == key else key,
+                {key: '▲', f'-{key}': '▼'}.get(sort, ''))
+               for key, label in utils.FLEET_COLUMNS.items()]
+    filters = [(key, f'{label} ({counts[key]})')
+               for key, label in {**utils.STATES, **utils.FLEET_MODES}.items() if counts[key]]
+    params = {
+        'rows': rows,
+        'columns': columns,
+        'filters': filters,
+        'total': sum(counts.values()),
+        'state': mode,
+        'sort': sort,
+        'actions': bulk_actions.ACTION_LABELS.items(),
+        'report': report,
+        'upload': uploads.get_upload(request.GET.get('upload', '')),
+    }
+    return render(request, 'ui_3d_app/fleet.html', params)
+
+
+@csrf_exempt
+@require_POST
+def upload(request):
+    # file is written to disk in chunks instead of memory, printers read it from there
+    request.upload_handlers = [TemporaryFileUploadHandler(request)]
+    form = PostPrintJobForm(request.POST, request.FILES)
+    if not form.is_valid():
+        return HttpResponse(form.errors.as_text(), status=400)
+    task = uploads.start_upload(list(form.cleaned_data['printers']),
+                                form.cleaned_data['job_name'], form.cleaned_data['file'])
+    logging.debug(f'Upload {task.id} of {task.filename} started')
+    return redirect(f'/fleet?upload={task.id}')
+
+
+def camera_stream(request, printer_id: int):
+    """
+    Printer camera relayed as MJPEG stream with reduced frame rate and size
+
+    Under WSGI the stream holds one server thread per viewer while it is open
+    """
+    db_printer = Printers.objects.filter(id=printer_id).first()
+    if db_printer is None:
+        return HttpResponse('Printer not found', status=404)
+    relay = camera_relay.get_relay(db_printer)
+    if relay is None:
+        return HttpResponse('Camera not available', status=404)
+    # Django collects a stream of the other kind into a list before sending it
+    frames = camera_relay.astream_frames(relay) if isinstance(request, ASGIRequest) \
+        else camera_relay.stream_frames(relay)
+    return StreamingHttpResponse(frames,
+                                 content_type=f'multipart/x-mixed-replace; boundary={camera_relay.BOUNDARY}',
+                                 headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def live(request, printer_id: int):
+    """
+    Server-Sent Events with changes of printer status and new logs
+
+    Under WSGI the stream holds one server thread per open dashboard while it is open
+    """
+    db_printer = Printers.objects.filter(id=printer_id).first()
+    if db_printer is None:
+        return HttpResponse('Printer not found', status=404)
+    hub = live_updates.get_hub(db_printer)
+    events = hub.astream() if isinstance(request, ASGIRequest) else hub.stream()
+    return StreamingHttpResponse(events, content_type='text/event-stream',
+                                 headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @csrf_exempt
 def about(request):
     params = {
@@ -152,8 +241,13 @@ def new_printer(request):
         name = request.POST.get('name')
         address = request.POST.get('address')
         logging.debug(f'New printer: {name}; {address}')
-        api_printer = UL(ip=address)
-        credentials = api_printer.get_credentials()
+        # registration is confirmed on the printer later; do not request other credentials on timeout
+        api_printer = UL(ip=address, auto_register=False)
+        try:
+            credentials = api_printer.get_credentials()
+        finally:
+            # registration is polled by the client of registry, this one would only time out
+            api_printer.close()
         db_printer = Printers(name=name, address=address,
                               api_id=credentials['id'],
                               api_key=credentials['key'])
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+from os import getenv
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -78,9 +79,30 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # keep per-thread connections open between requests
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # seconds to wait for a lock before "database is locked"
+            'timeout': 20,
+        },
     }
 }
 
+# Applied to every new SQLite connection by ui_3d_app.db.tune_sqlite:
+# WAL lets readers work while the CV watcher and log sink write
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'temp_store': 'MEMORY',
+}
+
+# Prune old logs from a background thread of the web server (ui_3d_app.retention).
+# Off by default: run "manage.py prune_logs" from cron, or set LOG_RETENTION_SCHEDULER=1
+# for exactly one server process
+LOG_RETENTION_SCHEDULER = getenv('LOG_RETENTION_SCHEDULER', '') == '1'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators